@@ -0,0 +1,175 @@
+"""
+Benchmark of the move path over a corpus of boards, reported as JSON
+    python benchmark.py [--corpus boards.json] [--boards 5] [--repeat 3] [--output result.json] [--baseline old.json]
+Times Preprocessing.__init__, get_weights (every grid, and lazily up to every level, exact and approximate),
+get_distance, get_shortest_path at several levels, the connectivity pass and Minimax.best_move at fixed depths, for every
+(board size, snake count) of the corpus. Without --corpus the corpus is generated from --seed, so two runs with the
+same arguments time the same boards.
+Every search mode of Minimax then searches every board for --budget ms, reported as nodes per second and depth reached,
+"/all" after a mode moves every rival, even the ones too far to meet me.
+With --baseline, the ratio to the mean of the same entry in a former result is added (> 1 means slower).
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+import corpus
+from minimax import Minimax, SEARCH_MODES
+from preprocessing import Preprocessing
+
+try:
+    from vectorized import VectorizedPreprocessing
+except ImportError:  # NumPy is not installed
+    VectorizedPreprocessing = None
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def run_board(data, preprocessing, levels, depths, repeat):
+    """
+    :return: {operation: [ms of every repetition]}
+    """
+    board, me = data["board"], data["you"]
+    y, x = me["head"]['y'], me["head"]['x']
+    times = defaultdict(list)
+    for _ in range(repeat):
+        times["init"].append(timed(preprocessing, board, me))
+        info = preprocessing(board, me)
+        times["get_weights"].append(timed(info.get_weights))
+        for level in levels:
+            times["get_weights/lazy%d" % level].append(timed(preprocessing(board, me).get_weights, level))
+            times["get_weights/approximate%d" % level].append(timed(preprocessing(board, me).get_weights, level, False))
+        times["get_distance"].append(timed(preprocessing(board, me).get_distance, y, x))
+        for level in levels:
+            times["get_shortest_path/%d" % level].append(timed(info.get_shortest_path, level))
+        times["connectivity"].append(timed(Minimax(board, me).connectivity))
+        for depth in depths:
+            search = Minimax(board, me)  # a new transposition table for every run
+            times["best_move/%d" % depth].append(timed(search.best_move, None, depth))
+    return times
+
+
+def summary(values):
+    values = sorted(values)
+    return {
+        "runs": len(values),
+        "mean_ms": round(statistics.mean(values), 4),
+        "median_ms": round(statistics.median(values), 4),
+        "min_ms": round(values[0], 4),
+        "max_ms": round(values[-1], 4),
+    }
+
+
+def run(boards, preprocessing, levels, depths, repeat):
+    groups = defaultdict(lambda: defaultdict(list))  # (width, height, snakes) -> operation -> ms
+    for data in boards:
+        board = data["board"]
+        group = groups[(board["width"], board["height"], len(board["snakes"]))]
+        for operation, values in run_board(data, preprocessing, levels, depths, repeat).items():
+            group[operation].extend(values)
+    return [dict(width=width, height=height, snakes=snakes, operation=operation, **summary(values))
+            for (width, height, snakes), group in sorted(groups.items()) for operation, values in group.items()]
+
+
+def search_board(data, modes, budget, repeat):
+    """
+    :param budget: seconds of every search
+    :return: {operation: [(nodes per second, depth reached) of every repetition]}
+    """
+    results = defaultdict(list)
+    for _ in range(repeat):
+        for mode in modes:
+            name, _, rivals = mode.partition("/")
+            search = Minimax(data["board"], data["you"], mode=name, prune=rivals != "all")
+            start = time.perf_counter()
+            search.best_move(start + budget, 64)
+            results["search/" + mode].append((search.nodes / (time.perf_counter() - start), search.depth_reached))
+    return results
+
+
+def run_searches(boards, modes, budget, repeat):
+    groups = defaultdict(lambda: defaultdict(list))  # (width, height, snakes) -> operation -> (nodes/s, depth)
+    for data in boards:
+        board = data["board"]
+        group = groups[(board["width"], board["height"], len(board["snakes"]))]
+        for operation, values in search_board(data, modes, budget, repeat).items():
+            group[operation].extend(values)
+    return [dict(width=width, height=height, snakes=snakes, operation=operation, runs=len(values),
+                 nodes_per_second=round(statistics.mean(nps for nps, _ in values)),
+                 mean_depth=round(statistics.mean(depth for _, depth in values), 2),
+                 min_depth=min(depth for _, depth in values))
+            for (width, height, snakes), group in sorted(groups.items()) for operation, values in group.items()]
+
+
+def compare(results, baseline):
+    previous = {(entry["width"], entry["height"], entry["snakes"], entry["operation"]): entry.get("mean_ms")
+                for entry in baseline["results"]}
+    for entry in results:
+        mean = previous.get((entry["width"], entry["height"], entry["snakes"], entry["operation"]))
+        if mean and "mean_ms" in entry:
+            entry["baseline_ratio"] = round(entry["mean_ms"] / mean, 3)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="JSON file of /move request bodies, generated when omitted")
+    parser.add_argument("--save-corpus", help="write the boards used to this file")
+    parser.add_argument("--sizes", type=int, nargs='+', default=corpus.SIZES)
+    parser.add_argument("--snakes", type=int, nargs='+', default=corpus.SNAKE_COUNTS)
+    parser.add_argument("--boards", type=int, default=5, help="boards per (size, snake count)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hazard-rings", type=int, default=0, help="outer rings covered by hazards, for royale boards")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every operation on every board")
+    parser.add_argument("--levels", type=int, nargs='*', default=[4, 8, 12], help="get_shortest_path() levels")
+    parser.add_argument("--depths", type=int, nargs='*', default=[2, 4, 6], help="Minimax.best_move() depths")
+    parser.add_argument("--modes", nargs='*', help="Minimax search modes to compare, see minimax.py",
+                        default=[mode + rivals for mode in SEARCH_MODES for rivals in ("", "/all")])
+    parser.add_argument("--budget", type=float, default=200, help="ms of every search of --modes")
+    parser.add_argument("--loops", action="store_true", help="time Preprocessing even if NumPy is installed")
+    parser.add_argument("--output", help="write the JSON to this file instead of stdout")
+    parser.add_argument("--baseline", help="former output to compare with")
+    args = parser.parse_args()
+
+    if args.corpus:
+        boards = corpus.load(args.corpus)
+    else:
+        boards = corpus.generate(args.sizes, args.snakes, args.boards, args.seed, args.hazard_rings)
+    if args.save_corpus:
+        corpus.save(boards, args.save_corpus)
+    preprocessing = Preprocessing if args.loops or VectorizedPreprocessing is None else VectorizedPreprocessing
+
+    start = time.perf_counter()
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "preprocessing": preprocessing.__name__,
+            "boards": len(boards),
+            "repeat": args.repeat,
+            "seed": None if args.corpus else args.seed,
+            "hazard_rings": None if args.corpus else args.hazard_rings,
+            "corpus": args.corpus,
+        },
+        "results": run(boards, preprocessing, args.levels, args.depths, args.repeat),
+    }
+    report["results"] += run_searches(boards, args.modes, args.budget / 1000, args.repeat)
+    report["meta"]["seconds"] = round(time.perf_counter() - start, 1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report["results"], json.load(f))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
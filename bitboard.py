@@ -0,0 +1,182 @@
+"""
+Bitboard representation of the board
+    - every layer is a Python int, bit (y * width + x) stands for the grid (x, y)
+    - flood fill grows the reachable area one ring at a time with shift-and-mask operations
+      instead of visiting the grids one by one
+"""
+
+masks_lookup = {}
+
+
+def get_masks(width, height):
+    """
+    :return: (full, not_left, not_right), computed once per board size
+        full        every grid of the board
+        not_left    every grid except the column x = 0
+        not_right   every grid except the column x = width - 1
+    """
+    masks = masks_lookup.get((width, height))
+    if masks is None:
+        full = (1 << (width * height)) - 1
+        left = 0
+        for y in range(height):
+            left |= 1 << (y * width)
+        masks = (full, full & ~left, full & ~(left << (width - 1)))
+        masks_lookup[(width, height)] = masks
+    return masks
+
+
+def popcount(mask):
+    return bin(mask).count("1")
+
+
+class Bitboard:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.full, self.not_left, self.not_right = get_masks(width, height)
+        self.occupied = 0  # (mine and rival snakes') body and heads, same as 1 <= board[y][x] <= 3
+        self.food = 0
+        self.heads = 0  # every snake's head, mine included
+        self.my_head = 0
+
+    @classmethod
+    def from_grid(cls, board, width, height):
+        """
+        Build the layers from the grid returned by Preprocessing.init_board()
+        """
+        bitboard = cls(width, height)
+        bit = 1
+        for y in range(height):
+            row = board[y]
+            for x in range(width):
+                if row[x]:
+                    if row[x] == 4:
+                        bitboard.food |= bit
+                    else:
+                        bitboard.occupied |= bit
+                        if row[x] == 3:
+                            bitboard.my_head |= bit
+                            bitboard.heads |= bit
+                        elif row[x] == 2:
+                            bitboard.heads |= bit
+                bit <<= 1
+        return bitboard
+
+    def bit(self, y, x):
+        return 1 << (y * self.width + x)
+
+    def cells(self, mask):
+        # Yield (y, x) of every grid in the mask
+        while mask:
+            low = mask & -mask
+            index = low.bit_length() - 1
+            yield divmod(index, self.width)
+            mask ^= low
+
+    def neighbors(self, mask):
+        # Every grid that is one move away from any grid of the mask
+        width = self.width
+        return ((mask << width) | (mask >> width) |
+                ((mask >> 1) & self.not_right) | ((mask << 1) & self.not_left)) & self.full
+
+    def flood_fill(self, y, x, occupied=None):
+        """
+        Same strategy as Preprocessing.get_distance(), but one whole ring per step
+        :return: (space, layers)
+            space       number of empty (or food) grids reachable from (x, y)
+            layers      layers[k] is the mask of grids whose distance to (x, y) is k,
+                        blocked grids are included in the ring they are first seen, but never expanded
+        """
+        if occupied is None:
+            occupied = self.occupied
+        free = self.full & ~occupied
+        start = self.bit(y, x)
+        visited = start
+        layers = [start]
+        ring = self.neighbors(start)
+        space = 0
+        while ring:
+            layers.append(ring)
+            visited |= ring
+            frontier = ring & free
+            space += popcount(frontier)
+            ring = self.neighbors(frontier) & ~visited
+        return space, layers
+
+    def get_space(self, y, x, occupied=None):
+        if occupied is None:
+            occupied = self.occupied
+        free = self.full & ~occupied
+        visited = self.bit(y, x)
+        ring = self.neighbors(visited)
+        reached = 0
+        while ring:
+            visited |= ring
+            ring &= free
+            reached |= ring
+            ring = self.neighbors(ring) & ~visited
+        return popcount(reached)
+
+    def voronoi(self, heads, occupied=None, food=None):
+        """
+        Flood fill from every head at once: a grid belongs to the snake that reaches it first. A grid reached on the
+        same step by several snakes goes to the longest one, it is contested (and not expanded) if they are as long
+        :param heads: [(y * width + x, length)] of every snake alive
+        :return: (owned, contested, reachable_food)
+            owned           owned[i] is the number of grids of heads[i]
+            contested       number of contested grids
+            reachable_food  reachable_food[i] is the number of food grids of heads[i]
+        """
+        if occupied is None:
+            occupied = self.occupied
+        if food is None:
+            food = self.food
+        width, not_left, not_right = self.width, self.not_left, self.not_right
+        free = self.full & ~occupied
+        fronts = [1 << cell for cell, _ in heads]
+        visited = 0
+        for front in fronts:
+            visited |= front
+        groups = {}  # length -> snakes of that length, the longest first
+        for i, (_, length) in enumerate(heads):
+            groups.setdefault(length, []).append(i)
+        groups = [groups[length] for length in sorted(groups, reverse=True)]
+
+        territory = [0] * len(heads)
+        contested = 0
+        available = free & ~visited
+        active = True
+        while active:
+            active = False
+            for group in groups:  # the grids taken by longer snakes on this step are no longer available
+                if len(group) == 1:
+                    i = group[0]
+                    front = fronts[i]
+                    if front:
+                        front = ((front << width) | (front >> width) | ((front >> 1) & not_right) |
+                                 ((front << 1) & not_left)) & available
+                        fronts[i] = front
+                        if front:
+                            territory[i] |= front
+                            available &= ~front
+                            active = True
+                    continue
+                once = twice = 0
+                for i in group:
+                    front = fronts[i]
+                    if front:
+                        front = ((front << width) | (front >> width) | ((front >> 1) & not_right) |
+                                 ((front << 1) & not_left)) & available
+                        fronts[i] = front
+                        twice |= once & front
+                        once |= front
+                for i in group:
+                    if fronts[i]:
+                        fronts[i] &= ~twice
+                        territory[i] |= fronts[i]
+                        active = True
+                contested |= twice
+                available &= ~once
+        owned = [popcount(mask) for mask in territory]
+        return owned, popcount(contested), [popcount(mask & food) for mask in territory]
@@ -0,0 +1,169 @@
+"""
+Connectivity of the free grids, computed once per position
+    - one depth-first search (Tarjan) finds the articulation points and the biconnected components of the graph of
+      the free grids, grids are flat indices y * width + x
+    - entering an articulation point splits its area, the snake then only keeps one of the parts: the size of every
+      part comes from the subtree sizes of the same search, so the space behind every candidate move of every snake
+      is known without a flood fill per move
+    - time to tail: a body grid frees up when the tail passes it, a part whose border frees up before the snake has
+      filled it is not a trap
+"""
+
+from math import inf
+
+adjacency_lookup = {}
+
+
+def get_adjacency(width, height):
+    """
+    :return: table[y * width + x] is the tuple of the grids next to (x, y), computed once per board size
+    """
+    table = adjacency_lookup.get((width, height))
+    if table is None:
+        table = tuple(tuple(Y * width + X for Y, X in ((y + 1, x), (y - 1, x), (y, x - 1), (y, x + 1))
+                            if 0 <= Y < height and 0 <= X < width)
+                      for y in range(height) for x in range(width))
+        adjacency_lookup[(width, height)] = table
+    return table
+
+
+def get_vacate_times(bodies, size):
+    """
+    :param bodies: body of every snake, flat grids head first
+    :return: vacate[cell] is the number of moves before the grid is free, 0 for a free grid. The tail is free already,
+        as on the board of Preprocessing. Assumes nobody eats, which frees the grids later
+    """
+    vacate = [0] * size
+    for body in bodies:
+        body = list(body)
+        last = len(body) - 1
+        for i in range(last - 1, -1, -1):  # the grid nearest the head wins for a stacked body
+            vacate[body[i]] = last - i
+    return vacate
+
+
+class Connectivity:
+    def __init__(self, width, height, occupied, vacate=None):
+        """
+        :param occupied: bitboard of the grids that are not free, see bitboard.py
+        :param vacate: see get_vacate_times(), None to ignore the tails
+        """
+        self.width = width
+        self.height = height
+        size = width * height
+        adjacency = get_adjacency(width, height)
+        bits = bin(occupied)[2:].zfill(size)[::-1]
+        self.free = free = [bit == '0' for bit in bits[:size]]
+
+        # border[cell] is the fewest moves before an occupied grid next to the free grid frees up
+        border = [inf] * size
+        if vacate is not None:
+            for cell in [cell for cell in range(size) if not free[cell]]:
+                time = vacate[cell]
+                for other in adjacency[cell]:
+                    if free[other] and time < border[other]:
+                        border[other] = time
+        self.border = border
+
+        self.order = [-1] * size  # preorder index of the grid in the search, -1 if occupied
+        low = [0] * size
+        parent = [-1] * size
+        self.subtree = subtree = [1] * size  # grids in the search subtree of the grid
+        self.component = [-1] * size  # connected component of the grid
+        self.component_start = []  # preorder index of the first grid of every component
+        self.component_size = []
+        self.separated = [()] * size  # children whose subtree is cut off when the grid is taken
+        self.articulation = set()
+        self.blocks = []  # biconnected components, every one a list of grids
+        preorder = []  # grids in preorder
+        order, component, separated = self.order, self.component, self.separated
+
+        for root in range(size):
+            if not free[root] or order[root] >= 0:
+                continue
+            number = len(self.component_size)
+            self.component_start.append(len(preorder))
+            order[root] = low[root] = len(preorder)
+            component[root] = number
+            preorder.append(root)
+            stack = [(root, iter(adjacency[root]))]
+            visited = [root]  # grids of the blocks not closed yet
+            while stack:
+                cell, others = stack[-1]
+                for other in others:
+                    if not free[other]:
+                        continue
+                    if order[other] < 0:
+                        parent[other] = cell
+                        order[other] = low[other] = len(preorder)
+                        component[other] = number
+                        preorder.append(other)
+                        visited.append(other)
+                        stack.append((other, iter(adjacency[other])))
+                        break
+                    if other != parent[cell] and order[other] < low[cell]:
+                        low[cell] = order[other]
+                else:
+                    stack.pop()
+                    up = parent[cell]
+                    if up < 0:
+                        continue
+                    subtree[up] += subtree[cell]
+                    if low[cell] < low[up]:
+                        low[up] = low[cell]
+                    if low[cell] >= order[up]:
+                        separated[up] += (cell,)
+                        if up != root:
+                            self.articulation.add(up)
+                        block = [up]
+                        while block[-1] != cell:
+                            block.append(visited.pop())
+                        self.blocks.append(block)
+            self.component_size.append(len(preorder) - self.component_start[-1])
+            if len(separated[root]) > 1:
+                self.articulation.add(root)
+        self.border_order = [border[cell] for cell in preorder]
+
+    def regions(self, cell):
+        """
+        :return: [(size, escape)] of every part left when a snake enters the grid, the grid itself not counted.
+            escape is the fewest moves before a grid on the border of the part (or next to the entered grid) frees up
+        """
+        if not self.free[cell]:
+            return []
+        here = self.border[cell]
+        borders = self.border_order
+        start = self.component_start[self.component[cell]]
+        end = start + self.component_size[self.component[cell]]
+        parts, cut = [], []
+        for child in self.separated[cell]:
+            first = self.order[child]
+            last = first + self.subtree[child]
+            parts.append((self.subtree[child], min(here, min(borders[first:last]))))
+            cut.append((first, last))
+        rest = end - start - 1 - sum(size for size, _ in parts)
+        if rest > 0:  # the part of the parent, every grid of the component outside the cut subtrees
+            escape, position = here, start
+            for first, last in sorted(cut + [(self.order[cell], self.order[cell] + 1)]):
+                if first > position:
+                    escape = min(escape, min(borders[position:first]))
+                position = last
+            if end > position:
+                escape = min(escape, min(borders[position:end]))
+            parts.append((rest, escape))
+        if not parts:
+            parts.append((0, here))
+        return parts
+
+    def space(self, cell):
+        """
+        :return: number of free grids a snake entering the grid can still reach, the same as Bitboard.get_space() for
+            a grid that is not an articulation point, the largest part for one that is
+        """
+        return max((size for size, _ in self.regions(cell)), default=0)
+
+    def is_trap(self, cell, length):
+        """
+        A part is a way out if it holds the snake's length, or if its border frees up before the snake has filled it
+        """
+        return not any(size >= length or escape <= size for size, escape in self.regions(cell))
@@ -0,0 +1,86 @@
+"""
+Corpus of random board states for benchmark.py and loadtest.py
+    - every board is a /move request body (game, turn, board, you), built from a seed so a corpus is reproducible
+    - a corpus can be saved to and loaded from a JSON file to compare releases on the exact same boards
+    - royale boards have hazards on their outer rings, as after a few shrinks of the royale ruleset
+"""
+
+import json
+import random
+
+SIZES = (7, 11, 19, 25)
+SNAKE_COUNTS = (2, 4, 6, 8)
+
+
+def royale_hazards(width, height, rings):
+    # Hazards on the rings outer rings of the board, in rows like the royale ruleset lists them
+    return [{"x": x, "y": y} for y in range(height) for x in range(width)
+            if min(x, y, width - 1 - x, height - 1 - y) < rings]
+
+
+def random_board(width, height, snakes, rng, hazard_rings=0):
+    """
+    Snakes are random walks from random heads, their length is up to a quarter of the board shared among them
+    :param hazard_rings: outer rings of the board covered by hazards
+    :return: data["board"], the first snake is "you"
+    """
+    occupied = set()
+    bodies = []
+    for _ in range(snakes):
+        x, y = rng.randrange(width), rng.randrange(height)
+        while (x, y) in occupied:
+            x, y = rng.randrange(width), rng.randrange(height)
+        body = [(x, y)]
+        occupied.add((x, y))
+        for _ in range(rng.randint(2, max(2, width * height // (snakes * 4)))):
+            cx, cy = body[-1]
+            free = [(cx + dx, cy + dy) for dx, dy in ((0, 1), (0, -1), (1, 0), (-1, 0))
+                    if 0 <= cx + dx < width and 0 <= cy + dy < height and (cx + dx, cy + dy) not in occupied]
+            if not free:
+                break
+            body.append(rng.choice(free))
+            occupied.add(body[-1])
+        bodies.append(body)
+    food = [(x, y) for x, y in ((rng.randrange(width), rng.randrange(height)) for _ in range(snakes))
+            if (x, y) not in occupied]
+    return {
+        "height": height, "width": width, "hazards": royale_hazards(width, height, hazard_rings),
+        "food": [{"x": x, "y": y} for x, y in food],
+        "snakes": [{"id": "snake-%d" % i, "name": "snake-%d" % i, "health": rng.randint(10, 100),
+                    "body": [{"x": x, "y": y} for x, y in body], "head": {"x": body[0][0], "y": body[0][1]},
+                    "length": len(body), "latency": "0", "shout": ""} for i, body in enumerate(bodies)],
+    }
+
+
+def random_game(width, height, snakes, seed, timeout=500, hazard_rings=0):
+    """
+    :return: a /move request body
+    """
+    board = random_board(width, height, snakes, random.Random(seed), hazard_rings)
+    return {"game": {"id": "corpus-%d" % seed, "timeout": timeout}, "turn": 0, "board": board,
+            "you": board["snakes"][0]}
+
+
+def generate(sizes=SIZES, snake_counts=SNAKE_COUNTS, boards=5, seed=0, hazard_rings=0):
+    """
+    :param boards: number of boards per (size, snake count)
+    :param hazard_rings: see random_board(), 0 for standard boards
+    :return: list of /move request bodies
+    """
+    corpus = []
+    for size in sizes:
+        for snakes in snake_counts:
+            for i in range(boards):
+                corpus.append(random_game(size, size, snakes, seed, hazard_rings=hazard_rings))
+                seed += 1
+    return corpus
+
+
+def save(corpus, path):
+    with open(path, 'w') as f:
+        json.dump(corpus, f)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,334 @@
+"""
+Seeded equivalence checks of the optimized code paths against the code they replace
+    python equivalence.py [--seed 0] [--boards 2] [--games 6] [check ...]
+Every check runs on the same boards: random boards of the corpus, standard and royale, and every turn of seeded
+self-play games, some of them royale. It prints its number of mismatches, the exit status is 1 if any check has one.
+    weights     VectorizedPreprocessing.get_weights() against the loops of Preprocessing.get_weights(), with the default
+                coefficients and with coefficients perturbed as by tuning.py
+    rings       the bit-parallel flood fill of Bitboard against the BFS of Preprocessing.get_distance(), from my head
+                and from random grids
+    paths       the memoized Preprocessing.get_shortest_path() against the recursive DFS it replaced
+    incremental the weights patched from the previous turn against a full rebuild, turn by turn along the games, with
+                the loops and with NumPy
+    lazy        the exact lazy mode of get_weights() against every grid weighed: the window, weigh() and the shortest
+                path of the same level
+    regions     the parts of Connectivity.regions() and the articulation points against a flood fill of the free grids
+                with the entered grid taken, from the free grids next to my head and from random free grids
+    collisions  Minimax.make_move() of a rival onto my head against the rules, with and without food on the grid, and
+                unmake_move() back to the position searched
+"""
+
+import argparse
+import random
+import sys
+from math import inf
+
+import corpus
+from connectivity import Connectivity, get_adjacency, get_vacate_times
+from hazards import Hazards
+from minimax import Minimax
+from preprocessing import Preprocessing, DEFAULT_COEFFICIENTS, INT_MAX, Coefficients
+from simulator import Game, weights_player, safest_player
+from tuning import perturb
+
+try:
+    from vectorized import VectorizedPreprocessing
+except ImportError:  # NumPy is not installed
+    VectorizedPreprocessing = None
+
+GAME_SIZES = (7, 11, 19)
+GAME_SNAKES = (2, 4, 8)
+PATH_LEVELS = (3, 5, 7)
+PERTURBED = 8  # perturbed coefficients of the weights check, every board is weighed with one of them
+
+
+def play_games(seed, games, max_turns=150):
+    """
+    Self-play of the weighted shortest path against the safest move, every other game shrinks like a royale game
+    :return: list of the turns of every game, a turn is {snake index: /move request body}
+    """
+    played = []
+    for i in range(games):
+        size, snakes = GAME_SIZES[i % len(GAME_SIZES)], GAME_SNAKES[i // len(GAME_SIZES) % len(GAME_SNAKES)]
+        game = Game(size, size, snakes, seed + i, shrink_every=5 if i % 2 else 0)
+        players = [weights_player(3) if j % 2 else safest_player for j in range(snakes)]
+        turns = []
+        while not game.is_over() and game.turn < max_turns:
+            requests = game.requests()
+            turns.append(requests)
+            game.step([players[j](requests[j]) if j in requests else None for j in range(snakes)])
+        played.append(turns)
+    return played
+
+
+def get_boards(seed, boards, games):
+    """
+    :return: (boards, games), boards is the list of /move request bodies of the corpus and of every turn of the games,
+        games is the return of play_games()
+    """
+    played = play_games(seed, games)
+    data = corpus.generate(boards=boards, seed=seed) + corpus.generate(boards=boards, seed=seed, hazard_rings=3)
+    for turns in played:
+        for requests in turns:
+            data.extend(requests.values())
+    return data, played
+
+
+def check_weights(boards, games, sigma=0.3):
+    """
+    :param sigma: spread of the perturbed coefficients, see tuning.perturb()
+    :return: (mismatches, compared)
+    """
+    rng = random.Random(0)
+    perturbed = [Coefficients(**perturb(DEFAULT_COEFFICIENTS, sigma, rng)) for _ in range(PERTURBED)]
+    mismatches = compared = 0
+    for i, data in enumerate(boards):
+        for coefficients in (None, perturbed[i % PERTURBED]):
+            loops = Preprocessing(data["board"], data["you"], coefficients)
+            loops.get_weights()
+            vectorized = VectorizedPreprocessing(data["board"], data["you"], coefficients)
+            vectorized.get_weights()
+            mismatches += vectorized.weights != loops.weights
+            compared += 1
+    return mismatches, compared
+
+
+def check_rings(boards, games, starts=3):
+    """
+    :param starts: random grids to flood from on every board, besides my head
+    """
+    rng = random.Random(0)
+    mismatches = compared = 0
+    for data in boards:
+        info = Preprocessing(data["board"], data["you"])
+        grids = [(info.me["head"]['y'], info.me["head"]['x'])]
+        grids += [(rng.randrange(info.height), rng.randrange(info.width)) for _ in range(starts)]
+        for y, x in grids:
+            space = info.get_distance(y, x)
+            rings = {}
+            for i in range(info.height):
+                for j in range(info.width):
+                    if info.distance[i][j] >= 0:
+                        rings.setdefault(info.distance[i][j], set()).add((i, j))
+            layers_space, layers = info.get_distance_layers(y, x)
+            mismatches += not (space == info.get_space(y, x) == layers_space and
+                               rings == {k: set(layer) for k, layer in enumerate(layers)})
+            compared += 1
+    return mismatches, compared
+
+
+def recursive_path(info, level):
+    """
+    Every path of at most level grids from my head, picked with the rules of get_shortest_path(), without the memo
+    :return: (best_direction, shortest_weight, path), same as get_shortest_path()
+    """
+    weights = info.weights
+
+    def search(y, x, level, visited):
+        # (shortest_weight, length, path) of the best continuation of at most level grids from (x, y)
+        if level == 0:
+            return 0, 0, []
+        best, best_path = None, []
+        for _, ny, nx in info.get_neighbors(y, x):
+            if (ny, nx) not in visited and weights[ny][nx] < INT_MAX:
+                weight, length, path = search(ny, nx, level - 1, visited | {(ny, nx)})
+                candidate = (length + 1, -(weight + weights[ny][nx]), -weights[ny][nx])
+                if best is None or candidate > best:
+                    best, best_path = candidate, [(weights[ny][nx], ny, nx)] + path
+        if best is None:
+            return 0, 0, []
+        return -best[1], best[0], best_path
+
+    y, x = info.me["head"]['y'], info.me["head"]['x']
+    best, result = None, (None, INT_MAX, [])
+    for direction, ny, nx in info.get_neighbors(y, x):
+        if weights[ny][nx] < INT_MAX:
+            weight, length, path = search(ny, nx, level - 1, {(y, x), (ny, nx)})
+            candidate = (length, -(weight + weights[ny][nx]), -weights[ny][nx])
+            if best is None or candidate > best:
+                best = candidate
+                result = (direction, weight + weights[ny][nx], [('Start', y, x), (weights[ny][nx], ny, nx)] + path)
+    return result
+
+
+def check_paths(boards, games):
+    mismatches = 0
+    for i, data in enumerate(boards):
+        info = Preprocessing(data["board"], data["you"])
+        info.get_weights()
+        level = PATH_LEVELS[i % len(PATH_LEVELS)]
+        mismatches += info.get_shortest_path(level) != recursive_path(info, level)
+    return mismatches, len(boards)
+
+
+def check_incremental(boards, games, restart=0.05):
+    """
+    Every snake of every game weighs its turns with the Hazards kept across the game, as the server does
+    :param restart: chance to weigh a turn from scratch, as after a lost session
+    """
+    rng = random.Random(0)
+    classes = [Preprocessing] + ([VectorizedPreprocessing] if VectorizedPreprocessing is not None else [])
+    mismatches = compared = 0
+    for preprocessing in classes:
+        for turns in games:
+            previous, hazards = {}, {}
+            for requests in turns:
+                for i, data in requests.items():
+                    board, me = data["board"], data["you"]
+                    full = Preprocessing(board, me)
+                    full.get_weights()
+                    if i not in hazards:
+                        hazards[i] = Hazards(board["width"], board["height"])
+                    info = preprocessing(board, me, previous=previous.get(i), hazards=hazards[i])
+                    info.get_weights()
+                    mismatches += info.weights != full.weights or info.hazard_weights != full.hazard_weights
+                    compared += 1
+                    previous[i] = info if rng.random() >= restart else None
+    return mismatches, compared
+
+
+def check_lazy(boards, games):
+    rng = random.Random(0)
+    mismatches = 0
+    for i, data in enumerate(boards):
+        full = Preprocessing(data["board"], data["you"])
+        full.get_weights()
+        level = PATH_LEVELS[i % len(PATH_LEVELS)]
+        lazy = Preprocessing(data["board"], data["you"])
+        lazy.get_weights(level)
+        same = full.get_shortest_path(level) == lazy.get_shortest_path(level)
+        same = same and all(weight is None or weight == full.weights[y][x]
+                            for y, row in enumerate(lazy.weights) for x, weight in enumerate(row))
+        y, x = rng.randrange(full.height), rng.randrange(full.width)
+        mismatches += not (same and lazy.weigh(y, x) == full.weights[y][x])
+    return mismatches, len(boards)
+
+
+def flood_regions(free, adjacency, vacate, cell):
+    """
+    :return: sorted [(size, escape)] of Connectivity.regions(cell), one flood fill per part
+    """
+    seen, parts = {cell}, []
+    for start in adjacency[cell]:
+        if free[start] and start not in seen:
+            part = [start]
+            seen.add(start)
+            for grid in part:
+                for other in adjacency[grid]:
+                    if free[other] and other not in seen:
+                        seen.add(other)
+                        part.append(other)
+            escape = min([vacate[other] for grid in part + [cell] for other in adjacency[grid] if not free[other]],
+                         default=inf)
+            parts.append((len(part), escape))
+    if not parts:
+        parts.append((0, min([vacate[other] for other in adjacency[cell] if not free[other]], default=inf)))
+    return sorted(parts)
+
+
+def check_regions(boards, games, cells=6):
+    """
+    :param cells: random free grids to enter on every board, besides the free grids next to my head
+    """
+    rng = random.Random(0)
+    mismatches = compared = 0
+    for data in boards:
+        info = Preprocessing(data["board"], data["you"])
+        width, size = info.width, info.width * info.height
+        bodies = [[body['y'] * width + body['x'] for body in snake["body"]] for snake in info.snakes]
+        vacate = get_vacate_times(bodies, size)
+        connectivity = Connectivity(width, info.height, info.bitboard.occupied, vacate)
+        adjacency = get_adjacency(width, info.height)
+        free = connectivity.free
+        head = info.me["head"]['y'] * width + info.me["head"]['x']
+        grids = [cell for cell in adjacency[head] if free[cell]]
+        grids += [cell for cell in (rng.randrange(size) for _ in range(cells)) if free[cell]]
+        for cell in grids:
+            parts = flood_regions(free, adjacency, vacate, cell)
+            articulation = len([part for part in parts if part[0] > 0]) > 1
+            mismatches += sorted(connectivity.regions(cell)) != parts or \
+                (cell in connectivity.articulation) != articulation
+            compared += 1
+    return mismatches, compared
+
+
+def search_state(search):
+    return (list(search.board), search.zobristHash(), search.occupied, search.food,
+            [(snake.alive, snake.length, snake.health, list(snake.body)) for snake in search.snakes])
+
+
+def check_collisions(boards, games):
+    """
+    Every rival whose head is two moves from mine meets me on a grid next to both heads, once without and once with a
+    food there. By the rules, both snakes eat the food, then the shorter one dies, both if they have the same length.
+    Grids with hazards and snakes that may starve on the move are left out, starving comes before the collisions
+    """
+    mismatches = compared = 0
+    for data in boards:
+        board, me = data["board"], data["you"]
+        width = board["width"]
+        hazards = {(hazard['y'], hazard['x']) for hazard in board.get("hazards") or []}
+        head = me["head"]['y'] * width + me["head"]['x']
+        for rival in board["snakes"]:
+            if rival["id"] == me["id"] or min(rival["health"], me["health"]) <= 1 or \
+                    abs(rival["head"]['y'] - me["head"]['y']) + abs(rival["head"]['x'] - me["head"]['x']) != 2:
+                continue
+            start = Minimax(board, me, table=False)
+            rival_head = rival["head"]['y'] * width + rival["head"]['x']
+            for _, cell in start.neighbors[head]:
+                y, x = divmod(cell, width)
+                if (y, x) in hazards or start.board[cell] not in (0, 4) or \
+                        all(other != cell for _, other in start.neighbors[rival_head]):
+                    continue
+                for food in (False, True):
+                    foods = [grid for grid in board["food"] if (grid['y'], grid['x']) != (y, x)]
+                    search = Minimax(dict(board, food=foods + [{"x": x, "y": y}] * food), me, table=False)
+                    before = search_state(search)
+                    snake = next(snake for snake in search.snakes if snake.name == rival["id"])
+                    mine, theirs = search.me.length + food, snake.length + food
+                    hash_value, first = search.make_move(search.me, cell, search.zobristHash())
+                    hash_value, second = search.make_move(snake, cell, hash_value)
+                    hash_value, last = search.end_round(hash_value)
+                    survivor = search.me if mine > theirs else snake if theirs > mine else None
+                    same = search.me.alive == (mine > theirs) and snake.alive == (theirs > mine)
+                    same = same and hash_value == search.zobristHash()
+                    if survivor is not None:
+                        same = same and survivor.length == max(mine, theirs) and (survivor.health == 100) == food
+                    for record in (last, second, first):
+                        search.unmake_move(record)
+                    mismatches += not (same and search_state(search) == before)
+                    compared += 1
+    return mismatches, compared
+
+
+CHECKS = {
+    "weights": check_weights,
+    "rings": check_rings,
+    "paths": check_paths,
+    "incremental": check_incremental,
+    "lazy": check_lazy,
+    "regions": check_regions,
+    "collisions": check_collisions,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("checks", nargs='*', help="checks to run among %s, every check if omitted" % ", ".join(CHECKS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--boards", type=int, default=2, help="corpus boards per (size, snake count)")
+    parser.add_argument("--games", type=int, default=6, help="self-play games")
+    args = parser.parse_args()
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error("unknown checks: %s" % ", ".join(unknown))
+
+    boards, games = get_boards(args.seed, args.boards, args.games)
+    failed = False
+    for name in args.checks or CHECKS:
+        if name == "weights" and VectorizedPreprocessing is None:
+            print("%-12s skipped, NumPy is not installed" % name)
+            continue
+        mismatches, compared = CHECKS[name](boards, games)
+        print("%-12s %d mismatches of %d" % (name, mismatches, compared))
+        failed = failed or mismatches > 0
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,57 @@
+"""
+Hazard layer of royale boards
+    - a move onto a hazard costs hazardDamagePerTurn health on top of the move, unless the grid holds food
+    - royale hazards only grow, from the edges, every few turns: the layer of a game is kept in its session and only
+      read again from board["hazards"] when the list changes, the bitboard and the grid are rebuilt on that turn only
+"""
+
+HAZARD_DAMAGE = 14  # default hazardDamagePerTurn of the royale ruleset
+
+
+def hazard_damage(game):
+    """
+    :param game: data["game"] of /move
+    """
+    settings = (game.get("ruleset") or {}).get("settings") or {}
+    return settings.get("hazardDamagePerTurn", HAZARD_DAMAGE)
+
+
+class Hazards:
+    def __init__(self, width, height, damage=HAZARD_DAMAGE):
+        self.width = width
+        self.height = height
+        self.damage = damage
+        self.mask = 0  # bitboard of the hazard grids, see bitboard.py
+        self.grid = None  # grid[y][x] is True on a hazard, None while there is none
+        self.signature = (0, None, None)  # (length, first, last) of the list the layer was read from
+        self.layer = None  # (weight, rows) of the last call of weights()
+
+    def update(self, hazards):
+        """
+        :param hazards: board["hazards"] of /move
+        :return: True if the layer changed
+        """
+        signature = (len(hazards), hazards[0] if hazards else None, hazards[-1] if hazards else None)
+        if signature == self.signature:
+            return False
+        mask = 0
+        for hazard in hazards:
+            mask |= 1 << (hazard['y'] * self.width + hazard['x'])
+        if mask != self.mask:
+            self.grid = [[bool(mask >> (y * self.width + x) & 1) for x in range(self.width)]
+                         for y in range(self.height)] if mask else None
+            self.layer = None
+        self.mask, self.signature = mask, signature
+        return True
+
+    def weights(self, weight):
+        """
+        :return: rows[y][x] is weight on a hazard, 0 elsewhere, shared by the turns until the hazards change
+        """
+        if self.layer is None or self.layer[0] != weight:
+            self.layer = (weight, [[weight if hazard else 0 for hazard in row] for row in self.grid])
+        return self.layer[1]
+
+    def cost(self, y, x, food=False):
+        # Health spent by a move onto the grid
+        return 1 if food or not self.mask >> (y * self.width + x) & 1 else 1 + self.damage
@@ -0,0 +1,74 @@
+"""
+Load test for a running server: plays N concurrent games and reports the /move latency
+    python loadtest.py [--url http://127.0.0.1:8080] [--games 16] [--turns 20] [--size 11] [--snakes 4]
+Each game is one thread that sends /start, one /move per turn as soon as the previous answer arrives, then /end.
+The boards are random, the latency is what the engine would see (network + queue + compute), and it is sent back in
+the next /move as the engine does.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.request
+
+from corpus import random_board
+
+
+def post(url, path, data):
+    request = urllib.request.Request(url + path, json.dumps(data).encode("utf-8"),
+                                     {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+
+def play(url, game_id, turns, size, snakes, timeout, latencies):
+    rng = random.Random(game_id)
+    data = {"game": {"id": "load-%d" % game_id, "timeout": timeout}, "turn": 0,
+            "board": random_board(size, size, snakes, rng)}
+    data["you"] = data["board"]["snakes"][0]
+    post(url, "/start", data)
+    latency = None
+    for turn in range(turns):
+        data["turn"] = turn
+        data["board"] = random_board(size, size, snakes, rng)
+        data["you"] = data["board"]["snakes"][0]
+        if latency is not None:
+            data["you"]["latency"] = str(int(latency))
+        start = time.perf_counter()
+        post(url, "/move", data)
+        latency = (time.perf_counter() - start) * 1000
+        latencies.append(latency)
+    post(url, "/end", data)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--games", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--size", type=int, default=11)
+    parser.add_argument("--snakes", type=int, default=4)
+    parser.add_argument("--timeout", type=int, default=500)
+    args = parser.parse_args()
+
+    latencies = []  # ms, list.append is thread safe
+    threads = [threading.Thread(target=play, args=(args.url, i, args.turns, args.size, args.snakes, args.timeout,
+                                                   latencies)) for i in range(args.games)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print("%d games, %d moves in %.1f s" % (args.games, len(latencies), elapsed))
+    print("latency ms: p50 %.1f, p90 %.1f, p99 %.1f, max %.1f" % tuple(
+        percentile(latencies, p) for p in (50, 90, 99, 100)))
+    print("over timeout: %d" % sum(latency > args.timeout for latency in latencies))
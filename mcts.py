@@ -0,0 +1,210 @@
+"""
+Monte Carlo Tree Search, an anytime alternative to Minimax for crowded boards
+    - decoupled UCT: every snake alive picks its own move at a node with UCB1 over its own statistics, the moves are
+      played as one round, me first then the rivals as in Minimax
+    - the tree is a pool of flat arrays indexed by node, not an object or a dict per node:
+        node_visits[node]               visits of the node
+        move_counts[node * n + i]       moves of the i-th snake at the node, -1 before the node is expanded
+        cells, visits, rewards[slot]    slot = (node * n + i) * 4 + move, the grid of the move and its statistics
+        children[node * 4 ** n + joint] child node of the joint move, joint = sum(move of i * 4 ** i)
+      with n the number of snakes of the root
+    - a rollout plays cheap moves up to rollout_depth rounds: mine follow the weights of Preprocessing, the rivals'
+      the free grids around the head, then every snake is scored by its Voronoi share of the board
+    - best_move() returns the move I visited most when the deadline passes, my moves into a trap are left out of the
+      root unless every move is one
+"""
+
+import math
+import random
+import time
+from array import array
+
+from minimax import Minimax
+
+
+class MCTS(Minimax):
+    def __init__(self, board, me, session=None, exploration=0.7, rollout_depth=8, epsilon=0.2, max_nodes=200000,
+                 seed=None):  # board = data["board"], me = data["me"]
+        """
+        :param exploration: UCB1 constant, the rewards are between 0 and 1
+        :param rollout_depth: rounds played by a rollout after the tree
+        :param epsilon: probability of a random move in a rollout
+        :param max_nodes: the tree stops growing beyond this, the iterations still refine its statistics
+        """
+        super().__init__(board, me, session, table=False)
+        self.exploration = exploration
+        self.rollout_depth = rollout_depth
+        self.epsilon = epsilon
+        self.max_nodes = max_nodes
+        self.random = random.Random(seed)
+        self.start.get_weights()
+        self.weights = [weight for row in self.start.weights for weight in row]  # my rollout policy, lower is better
+        self.iterations = 0
+
+    def reset_tree(self):
+        self.count = len(self.snakes)  # n of the module docstring
+        self.node_visits = array('i')
+        self.move_counts = array('b')
+        self.cells = array('i')
+        self.visits = array('i')
+        self.rewards = array('d')
+        self.children = {}
+        self.new_node()
+
+    def new_node(self):
+        n = self.count
+        self.node_visits.append(0)
+        self.move_counts.extend([-1] * n)
+        self.cells.extend([-1] * (4 * n))
+        self.visits.extend([0] * (4 * n))
+        self.rewards.extend([0.0] * (4 * n))
+        return len(self.node_visits) - 1
+
+    def is_free(self, cell):
+        # Free at the start of a round: every head moves, so a grid holding a head is body by the end of the round
+        return not (self.occupied >> cell) & 1
+
+    def expand(self, node):
+        base = node * self.count
+        for i, snake in enumerate(self.snakes):
+            count = 0
+            if snake.alive:
+                for _, cell in self.neighbors[snake.body[0]]:
+                    if self.is_free(cell):
+                        self.cells[(base + i) * 4 + count] = cell
+                        count += 1
+            self.move_counts[base + i] = count
+
+    def select(self, node):
+        """
+        :return: [move of every snake, -1 for the snakes that do not move] by UCB1, the moves never tried first
+        """
+        base = node * self.count
+        log_visits = math.log(self.node_visits[node] + 1)
+        joint = []
+        for i in range(self.count):
+            count = self.move_counts[base + i]
+            best, best_value = -1, -1.0
+            for move in range(count):
+                slot = (base + i) * 4 + move
+                visits = self.visits[slot]
+                if not visits:
+                    best = move
+                    break
+                value = self.rewards[slot] / visits + self.exploration * math.sqrt(log_visits / visits)
+                if value > best_value:
+                    best, best_value = move, value
+            joint.append(best)
+        return joint
+
+    def play_round(self, cells, undo):
+        """
+        Plays one move of every snake, None for a snake with no move, which dies. The records go to undo
+        """
+        for snake, cell in zip(self.snakes, cells):
+            if not snake.alive:
+                continue  # dead before this round, or killed head-to-head earlier in it
+            if cell is None:
+                changes, heads = [], []
+                self.remove_snake(snake, 0, changes, heads)
+                undo.append((snake, snake.health, snake.length, False, None, changes, heads, [snake], None))
+            else:
+                undo.append(self.make_move(snake, cell, 0)[1])
+        undo.append(self.end_round(0)[1])
+
+    def rollout_move(self, snake):
+        cells = [cell for _, cell in self.neighbors[snake.body[0]] if self.is_free(cell)]
+        if not cells:
+            return None
+        if len(cells) == 1 or self.random.random() < self.epsilon:
+            return self.random.choice(cells)
+        if snake is self.me:
+            return min(cells, key=self.weights.__getitem__)
+        return max(cells, key=lambda cell: sum(self.is_free(to_cell) for _, to_cell in self.neighbors[cell]))
+
+    def rollout(self, undo):
+        for _ in range(self.rollout_depth):
+            if not self.me.alive or sum(snake.alive for snake in self.snakes) < 2:
+                break
+            self.play_round([self.rollout_move(snake) if snake.alive else None for snake in self.snakes], undo)
+        return self.get_rewards()
+
+    def get_rewards(self):
+        """
+        :return: reward of every snake, 0 if dead, 1 if the only one alive, else 0.5 plus half its Voronoi share
+        """
+        alive = [i for i, snake in enumerate(self.snakes) if snake.alive]
+        rewards = [0.0] * self.count
+        if len(alive) == 1:
+            rewards[alive[0]] = 1.0
+        elif alive:
+            heads = [(self.snakes[i].body[0], self.snakes[i].length) for i in alive]
+            owned = self.start.bitboard.voronoi(heads, self.occupied, self.food)[0]
+            total = sum(owned) or 1
+            for i, grids in zip(alive, owned):
+                rewards[i] = 0.5 + 0.5 * grids / total
+        return rewards
+
+    def iterate(self):
+        """
+        One selection, expansion, rollout and backpropagation, the board is restored afterwards
+        """
+        n = self.count
+        node, path, undo = 0, [], []
+        while self.me.alive:
+            if self.move_counts[node * n] < 0:
+                self.expand(node)
+            joint = self.select(node)
+            path.append((node, joint))
+            base = node * n
+            self.play_round([self.cells[(base + i) * 4 + move] if move >= 0 else None
+                             for i, move in enumerate(joint)], undo)
+            key = node * 4 ** n + sum(max(move, 0) * 4 ** i for i, move in enumerate(joint))
+            child = self.children.get(key)
+            if child is None:
+                if len(self.node_visits) < self.max_nodes:
+                    self.children[key] = self.new_node()
+                break
+            node = child
+        rewards = self.rollout(undo)
+        for record in reversed(undo):
+            self.unmake_move(record)
+
+        for node, joint in path:
+            self.node_visits[node] += 1
+            base = node * n
+            for i, move in enumerate(joint):
+                if move >= 0:
+                    slot = (base + i) * 4 + move
+                    self.visits[slot] += 1
+                    self.rewards[slot] += rewards[i]
+        self.iterations += 1
+
+    def best_move(self, deadline=None, iterations=1000):
+        """
+        :param deadline: time.perf_counter() value, None to run iterations iterations
+        :return: the direction I visited most at the root, None if every move is a dead end
+        """
+        self.reset()
+        self.reset_tree()
+        self.iterations = 0
+        self.expand(0)
+        mine = self.snakes.index(self.me)
+        traps = self.find_traps()
+        if traps:  # not every move is a trap, the others are the only ones tried at the root
+            cells = [self.cells[mine * 4 + move] for move in range(self.move_counts[mine])]
+            cells = [cell for cell in cells if cell not in traps]
+            for move in range(4):
+                self.cells[mine * 4 + move] = cells[move] if move < len(cells) else -1
+            self.move_counts[mine] = len(cells)
+        count = self.move_counts[mine]
+        if count == 0:
+            return None
+        if count > 1:
+            while (self.iterations < iterations) if deadline is None else (time.perf_counter() < deadline):
+                self.iterate()
+        slots = [mine * 4 + move for move in range(count)]
+        best = max(slots, key=lambda slot: (self.visits[slot], self.rewards[slot]))
+        self.best_score = self.rewards[best] / self.visits[best] if self.visits[best] else None
+        self.nodes = len(self.node_visits)
+        return next(direction for direction, cell in self.neighbors[self.me.body[0]] if cell == self.cells[best])
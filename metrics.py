@@ -0,0 +1,126 @@
+"""
+Metrics of the server, served by /metrics in the Prometheus text format
+    - histograms and counters are plain lists and dicts in memory, aggregated since the server started
+    - recording a value is a bisect and a dict update under a lock, about a microsecond
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0)  # seconds
+DEPTH_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 12, 16, 20, 24, 32)
+
+
+def label_text(label, value):
+    return '{%s="%s"}' % (label, value) if label is not None else ''
+
+
+class Counter:
+    def __init__(self, name, description, label=None):
+        """
+        :param label: name of the label that splits the counter into series, None for a single series
+        """
+        self.name = name
+        self.description = description
+        self.label = label
+        self.values = {}  # label value -> count
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, value=None):
+        with self.lock:
+            self.values[value] = self.values.get(value, 0) + amount
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.description), "# TYPE %s counter" % self.name]
+        with self.lock:
+            for value, count in sorted(self.values.items(), key=lambda item: str(item[0])):
+                lines.append("%s%s %s" % (self.name, label_text(self.label, value), count))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, buckets, label=None):
+        """
+        :param buckets: sorted upper bounds, the +Inf bucket is added
+        :param label: name of the label that splits the histogram into series, None for a single series
+        """
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.label = label
+        self.series = {}  # label value -> [count of every bucket (not cumulative) and +Inf, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, amount, value=None):
+        i = bisect_left(self.buckets, amount)  # first bucket whose bound is >= amount
+        with self.lock:
+            series = self.series.get(value)
+            if series is None:
+                series = self.series[value] = [0] * (len(self.buckets) + 1) + [0]
+            series[i] += 1
+            series[-1] += amount
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.description), "# TYPE %s histogram" % self.name]
+        with self.lock:
+            for value, series in sorted(self.series.items(), key=lambda item: str(item[0])):
+                labels = '%s="%s",' % (self.label, value) if self.label is not None else ''
+                total = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series):
+                    total += count
+                    lines.append('%s_bucket{%sle="%s"} %s' % (self.name, labels, bound, total))
+                lines.append("%s_sum%s %s" % (self.name, label_text(self.label, value), series[-1]))
+                lines.append("%s_count%s %s" % (self.name, label_text(self.label, value), total))
+        return lines
+
+
+class Metrics:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.phases = Histogram("nidhogg_phase_seconds", "Time spent in each phase of a request.",
+                                LATENCY_BUCKETS, "phase")
+        self.moves = Histogram("nidhogg_move_seconds", "Time spent answering /move, without the JSON encoding.",
+                               LATENCY_BUCKETS, "engine")
+        self.depth = Histogram("nidhogg_search_depth", "Depth completed by the iterative deepening of Minimax.",
+                               DEPTH_BUCKETS)
+        self.nodes = Counter("nidhogg_search_nodes_total", "Nodes searched by Minimax.")
+        self.probes = Counter("nidhogg_tt_probes_total", "Transposition table probes.")
+        self.hits = Counter("nidhogg_tt_hits_total", "Transposition table probes that found the position.")
+        self.cutoffs = Counter("nidhogg_search_cutoffs_total", "Minimax nodes cut off by alpha-beta.")
+        self.first_cutoffs = Counter("nidhogg_search_first_cutoffs_total",
+                                     "Minimax nodes cut off by alpha-beta on the first move searched.")
+
+    def phase(self, name, since):
+        """
+        Records the time since the perf_counter() value since as the phase name
+        :return: perf_counter() now, the start of the next phase
+        """
+        now = time.perf_counter()
+        if self.enabled:
+            self.phases.observe(now - since, name)
+        return now
+
+    def move(self, engine, since):
+        if self.enabled:
+            self.moves.observe(time.perf_counter() - since, engine)
+
+    def search(self, search, probes, hits):
+        """
+        :param search: Minimax after best_move()
+        :param probes, hits: counters of its transposition table before best_move()
+        """
+        if self.enabled:
+            self.depth.observe(search.depth_reached)
+            self.nodes.inc(search.nodes)
+            self.probes.inc(search.table.probes - probes)
+            self.hits.inc(search.table.hits - hits)
+            self.cutoffs.inc(search.cutoffs)
+            self.first_cutoffs.inc(search.first_cutoffs)
+
+    def render(self):
+        lines = []
+        for metric in (self.phases, self.moves, self.depth, self.nodes, self.probes, self.hits, self.cutoffs,
+                       self.first_cutoffs):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
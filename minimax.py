@@ -1,10 +1,20 @@
 """
 Implementing Minimax Algorithm
     - while applying Alpha-Beta Pruning for optimization
+    - two ways to search the rivals, chosen per game:
+        best-reply  after my move a single rival replies, the rival whose best reply is the worst for me. The others
+                    stand still, so a round costs my moves x the sum of the moves of the rivals
+        paranoid    after my move every rival moves in turn against me, a round costs my moves x the product of the
+                    moves of the rivals, exact for a single rival but too expensive for a crowded board
+    - the rivals whose head is too far from mine to meet me within the remaining depth do not move in either mode
 """
 
-from preprocessing import Preprocessing
+from connectivity import Connectivity, get_vacate_times
+from preprocessing import Preprocessing, get_cell_neighbors_table
+from snake import build_snakes
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
 import random
+import time
 from math import inf
 
 """
@@ -16,174 +26,539 @@ Heuristics:
 5. Weighted score based on the distance to the food
 6. If same score, choose the closest position to the center of the board
 """
-created_lookup = False
-zobrist_lookup_table = []
+BEST_REPLY = "best-reply"
+PARANOID = "paranoid"
+SEARCH_MODES = (BEST_REPLY, PARANOID)
+
+zobrist_lookup = {}
+ZOBRIST_SEED = 0x4E696468  # the keys must not change between runs, the position cache on disk depends on them
+
+
+def get_zobrist_table(width, height):
+    """
+    Zobrist Hashing algorithm, one table per board size, always the same keys for the same size
+        table[y * width + x][index], index:
+            0       empty
+            1       body
+            2       food
+            3-63    my head       2 + length
+            64-124  rival's head  63 + length
+    """
+    table = zobrist_lookup.get((width, height))
+    if table is None:
+        rng = random.Random(ZOBRIST_SEED ^ (width << 16) ^ height)
+        table = [[0] + [rng.randint(1, 2**64 - 1) for _ in range(124)] for _ in range(width * height)]
+        zobrist_lookup[(width, height)] = table
+    return table
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside minimax() when the deadline passes, the unfinished iteration is thrown away
+    """
+    pass
 
 
 class Minimax:
-    def __init__(self, board, me):  # board = data["board"], me = data["me"]
-        global zobrist_lookup_table, created_lookup
-        self.start = Preprocessing(board, me)
-        """
-        Zobrist Hashing algorithm
-            state: object / length (if applicable)
-            index:
-                0       empty 
-                1       body
-                2       food
-                3-63    my head       2 + length
-                64-124  rival's head  63 + length      
-                               
-        """
-        if not created_lookup:
-            zobrist_lookup_table = [[[0] + [random.randint(1, 2**64 - 1) for _ in range(124)] for _ in range(self.start.width)] for _ in range(self.start.height)]
-            created_lookup = True
-        self.zobrist_lookup = zobrist_lookup_table
-        self.states = [[] for _ in range(2 ** 16)]
-
-    def zobristHash(self, board=None):
-        if board is None:
-            board = self.start.board
+    def __init__(self, board, me, session=None, mode=None, prune=True, table=True):
+        """
+        board = data["board"], me = data["me"]
+        :param mode: BEST_REPLY or PARANOID, None for the mode of the session, else BEST_REPLY
+        :param prune: let the rivals too far to meet me stand still
+        :param table: False if minimax() is never called, e.g. by MCTS or to hash a position, no transposition table
+            is built then
+        """
+        self.start = Preprocessing(board, me, hazards=session.hazards if session is not None else None)
+        self.mode = mode or (session.search_mode if session is not None else None) or BEST_REPLY
+        self.prune = prune
+        if session is not None:  # reuse the tables of the previous turns of this game
+            self.zobrist_lookup = session.zobrist_lookup
+            self.snake_ids = session.snake_ids
+            self.player_keys = session.player_keys
+            self.table = session.get_table() if table else None
+            self.history = session.history
+        else:
+            self.zobrist_lookup = get_zobrist_table(self.start.width, self.start.height)
+            self.snake_ids = {}
+            self.player_keys = []
+            self.table = TranspositionTable() if table else None
+            self.history = {}
+        self.neighbors = get_cell_neighbors_table(self.start.width, self.start.height)
+        self.hazard_mask, self.hazard_damage = self.start.hazards.mask, self.start.hazards.damage
+        # self.history[(snake id, from grid, direction)] grows every time the move causes a cutoff
+
+        self.deadline = None  # time.perf_counter() value at which the search must stop, None for no limit
+        self.check_mask = 0xFF  # the deadline is checked every check_mask + 1 nodes
+        self.pacer = None  # called every check_mask + 1 nodes if set, see ponder.py
+        self.nodes = 0
+        self.depth_reached = 0
+        self.best_score = None  # score of the move returned by best_move()
+        self.root_depth = 0  # depth of the current iteration, the ply of a node is root_depth - depth
+        self.killers = {}  # (ply, snake id) -> the last two moves that caused a cutoff at this ply
+        self.cutoffs = 0  # nodes where alpha >= beta stopped the loop over the moves
+        self.first_cutoffs = 0  # ... on the first move searched, the share tells how good the move ordering is
+
+        self.reset()  # gives an integer id to the snakes seen for the first time
+        # The same board is a different node for every player to move, state hash ^ player key is the table key
+        while len(self.player_keys) < len(self.snake_ids):  # self.player_keys[integer id]
+            self.player_keys.append(random.randint(1, 2**64 - 1))
+
+    def reset(self):
+        """
+        Search state, changed in place by make_move() and restored by unmake_move()
+            self.board      flat copy of self.start.board, self.board[y * width + x]
+            self.occupied   bitboard of the grids with 1 <= self.board[cell] <= 3
+            self.food       bitboard of the grids with self.board[cell] == 4
+            self.snakes     Snake of every snake, see snake.py
+            self.head_at    self.head_at[cell] is the Snake alive whose head is on the grid, None for no head
+            self.pending    grids left by a tail in this round, still body until end_round() frees them
+        """
+        self.board = [value for row in self.start.board for value in row]
+        self.occupied = self.start.bitboard.occupied
+        self.food = self.start.bitboard.food
+        self.snakes = build_snakes(self.start.snakes, self.start.width, self.snake_ids)
+        self.me = next(snake for snake in self.snakes if snake.name == self.start.me["id"])
+        self.head_at = [None] * len(self.board)
+        self.pending = []
+        for snake in self.snakes:
+            self.head_at[snake.body[0]] = snake
+
+    def head_type(self, snake):
+        return (2 if snake is self.me else 63) + min(snake.length, 61)
+
+    def zobristHash(self):
         hash_value = 0
-        for i in range(self.start.height):
-            for j in range(self.start.width):
-                if board[i][j]:
-                    obj = 0
-                    if board[i][j] == 1:
-                        obj = 1
-                    elif board[i][j] == 4:
-                        obj = 2
-                    hash_value ^= self.zobrist_lookup[i][j][obj]
-        for snake in self.start.snakes:
-            if snake["id"] == self.start.me["id"]:
-                hash_value ^= self.zobrist_lookup[snake["head"]['y']][snake["head"]['x']][2 + snake["length"]]
-            else:
-                hash_value ^= self.zobrist_lookup[snake["head"]['y']][snake["head"]['x']][63 + snake["length"]]
+        for cell, value in enumerate(self.board):
+            if value == 1:
+                hash_value ^= self.zobrist_lookup[cell][1]
+            elif value == 4:
+                hash_value ^= self.zobrist_lookup[cell][2]
+        for snake in self.snakes:
+            if snake.alive:
+                hash_value ^= self.zobrist_lookup[snake.body[0]][self.head_type(snake)]
         return hash_value
 
-    def add_to_hash_table(self, hash_value):
-        index = hash_value & 0xFFFF
-        if not self.in_hashtable(hash_value, index):
-            self.states[index].append(hash_value)
-
-    def in_hashtable(self, hash_value, index=None):
-        if index is None:
-            index = hash_value & 0xFFFF
-        for hv in self.states[index]:
-            if hv == hash_value:
-                return True
-        return False
+    def set_cell(self, cell, value, changes):
+        changes.append((cell, self.board[cell]))
+        if self.board[cell] == 4:
+            self.food &= ~(1 << cell)
+        self.board[cell] = value
+        if 1 <= value <= 3:
+            self.occupied |= 1 << cell
+        else:
+            self.occupied &= ~(1 << cell)
+
+    def set_head(self, cell, snake, heads):
+        heads.append((cell, self.head_at[cell]))
+        self.head_at[cell] = snake
 
-    def find_snake(self, position_y, position_x):
-        pass
-
-    def move_snake(self, snake, direction, forward=True, state_board=None):
-        if state_board is None:
-            state_board = self.start.board
-        pass
-
-    def update_state_hash_value(self, hash_value, snake, to_position_y, to_position_x, board=None):
-        if board is None:
-            board = self.start.board
-        zobrist_type = 2 + snake["length"] if snake["id"] == self.start.me["id"] else 63 + snake["length"]
-        hash_value ^= self.zobrist_lookup[snake.head['y']][snake.head['x']][zobrist_type]  # head away
-        hash_value ^= self.zobrist_lookup[to_position_y][to_position_x][zobrist_type]  # head to
-        hash_value ^= self.zobrist_lookup[snake["body"][-2]['y']][snake["body"][-2]['x']][1]  # tail away
-        # remove hash_value for object at to_position
-        if board[to_position_y][to_position_x] == 1:
-            hash_value ^= self.zobrist_lookup[to_position_y][to_position_x][1]
-        elif board[to_position_y][to_position_x] == 4:
-            hash_value ^= self.zobrist_lookup[to_position_y][to_position_x][4]
-        elif board[to_position_y][to_position_x] in [2, 3]:
-            for snake in self.start.snakes:
-                if snake["head"]['y'] == to_position_y and snake["head"]['x'] == to_position_x:
-                    if snake["id"] == self.start.me["id"]:
-                        hash_value ^= self.zobrist_lookup[to_position_y][to_position_x][2 + snake["length"]]
-                    else:
-                        hash_value ^= self.zobrist_lookup[to_position_y][to_position_x][63 + snake["length"]]
+    def remove_snake(self, snake, hash_value, changes, heads):
+        """
+        Clear a dead snake from the board, only its marked grids (body[:-1]) are on the board
+        :return: new hash value
+        """
+        body = snake.body
+        head = body[0]
+        if self.board[head] in (2, 3):
+            hash_value ^= self.zobrist_lookup[head][self.head_type(snake)]
+            self.set_cell(head, 0, changes)
+        if self.head_at[head] is snake:
+            self.set_head(head, None, heads)
+        for cell in set(body[i] for i in range(1, len(body) - 1)):
+            if self.board[cell] == 1:
+                hash_value ^= self.zobrist_lookup[cell][1]
+                self.set_cell(cell, 0, changes)
+        snake.alive = False
         return hash_value
 
-    def is_dead_end(self, snake, to_position_y, to_position_x, state_board=None):
-        if state_board is None:
-            state_board = self.start.board
-        if state_board[to_position_y][to_position_x] == 1:  # body
+    def make_move(self, snake, to_cell, hash_value):
+        """
+        Move the snake's head to the grid to_cell, updating the board, the snake and the hash value in place.
+        The head must not be a dead end (see is_dead_end()), moving onto a head is a head-to-head collision
+        :return: (new hash value, undo record for unmake_move())
+        """
+        lookup = self.zobrist_lookup
+        body = snake.body
+        health, length = snake.health, snake.length
+        changes, heads, dead = [], [], []
+        previous = self.board[to_cell]
+
+        eats = previous == 4
+        if previous == 2 or previous == 3:  # head-to-head, the shorter one dies, both die if same length
+            rival = self.head_at[to_cell]
+            # Only a snake that has just eaten has full health: the grid held food, which both snakes eat before
+            # their lengths are compared
+            eats = rival.health == 100
+            if rival.length <= length + eats:
+                hash_value = self.remove_snake(rival, hash_value, changes, heads)
+                dead.append(rival)
+            if rival.length >= length + eats:
+                hash_value = self.remove_snake(snake, hash_value, changes, heads)
+                dead.append(snake)
+                return hash_value, (snake, health, length, False, None, changes, heads, dead, None)
+
+        # the head leaves its grid, which becomes body
+        head = body[0]
+        hash_value ^= lookup[head][self.head_type(snake)] ^ lookup[head][1]
+        self.set_cell(head, 1, changes)
+        self.set_head(head, None, heads)
+        body.appendleft(to_cell)
+        tail = pending = None
+        if eats:
+            if previous == 4:  # else the rival killed head-to-head ate the food first
+                hash_value ^= lookup[to_cell][2]
+            snake.health = 100
+            snake.length += 1
+        else:
+            snake.health -= 1 + self.hazard_damage if self.hazard_mask >> to_cell & 1 else 1
+            tail = body.pop()
+            # the second last grid becomes the tail, which is free for the next round but not for the snakes that
+            # move after this one in the round
+            last = body[-1]
+            if len(body) > 1 and body[-2] != last and self.board[last] == 1:
+                pending = last
+                self.pending.append(last)
+        hash_value ^= lookup[to_cell][self.head_type(snake)]
+        self.set_cell(to_cell, 3 if snake is self.me else 2, changes)
+        self.set_head(to_cell, snake, heads)
+
+        if snake.health <= 0:
+            hash_value = self.remove_snake(snake, hash_value, changes, heads)
+            dead.append(snake)
+        return hash_value, (snake, health, length, True, tail, changes, heads, dead, pending)
+
+    def end_round(self, hash_value):
+        """
+        Frees the grids left by the tails in the round, once every snake of the round has moved
+        :return: (new hash value, undo record for unmake_move())
+        """
+        changes = []
+        for cell in self.pending:
+            if self.board[cell] == 1:  # not cleared with a dead snake
+                hash_value ^= self.zobrist_lookup[cell][1]
+                self.set_cell(cell, 0, changes)
+        pending, self.pending = self.pending, []
+        return hash_value, (None, 0, 0, False, None, changes, [], [], pending)
+
+    def unmake_move(self, undo):
+        snake, health, length, moved, tail, changes, heads, dead, pending = undo
+        board = self.board
+        for cell, value in reversed(changes):
+            board[cell] = value
+            if 1 <= value <= 3:
+                self.occupied |= 1 << cell
+            else:
+                self.occupied &= ~(1 << cell)
+                if value == 4:
+                    self.food |= 1 << cell
+        for cell, any_snake in reversed(heads):
+            self.head_at[cell] = any_snake
+        for any_snake in dead:
+            any_snake.alive = True
+        if snake is None:  # end_round()
+            self.pending = pending
+            return
+        if pending is not None:
+            self.pending.pop()
+        if moved:
+            snake.body.popleft()
+            if tail is not None:
+                snake.body.append(tail)
+        snake.health, snake.length = health, length
+
+    def is_dead_end(self, snake, to_cell):
+        """
+        Heads that have not moved in this round will be body in the next turn, so only my head, which always moves
+        first in a round, can be hit head-to-head
+        """
+        value = self.board[to_cell]
+        if value == 1:  # body
+            return True
+        if value == 2:  # rival's head
             return True
-        if state_board[to_position_y][to_position_x] == 2:  # rival's head
-            for any_snake in self.start.snakes:
-                if any_snake["head"]['y'] == to_position_y and any_snake["head"]['x'] == to_position_x \
-                        and any_snake["length"] >= snake["length"]:
-                    return True
+        if value == 3:  # my head
+            return snake is self.me
         return False
 
-    def get_score(self, state_board=None):
-        if state_board is None:
-            state_board = self.start.board
-        pass
-
-    def minimax(self, state_hash_value, depth, player, alpha, beta, state_board=None):
-        """
-        :return: (best_score, best_direction, killed_rival?)
-        """
-        if state_board is None:
-            state_board = self.start.board
-        if depth == 0:
-            return self.get_score(state_board), None, None
-
-        if player["id"] == self.start.me["id"]:  # maximizing player
-            best_score, best_direction, killed_rival = -inf, None, False
-            for direction, ny, nx in self.start.get_neighbors(player["head"]['y'], player["head"]['x']):
-                if not self.is_dead_end(player, ny, nx, state_board):
-                    new_hash_value = self.update_state_hash_value(state_hash_value, player, ny, nx, state_board)
-                    previous = state_board[ny][nx]
-                    has_food = (previous == 4)
-                    can_kill_rival = (previous == 2)
-                    self.move_snake(player, direction, True, state_board)
-                    if can_kill_rival:
-                        self.find_snake(ny, nx)
-                        # remove the snake
-                        pass
-
-                    score, kill = -inf, 0
-                    for snake in self.start.snakes:
-                        if snake["id"] != player["id"]:
-                            this_score, _, this_kill = self.minimax(new_hash_value, depth-1, snake, alpha, beta)
-                            if this_score > score or (this_score == score and this_kill > kill):
-                                score, kill = this_score, this_kill
-
-                    if score >= best_score and score > -inf:
-                        best_score = score
-                        best_direction = [direction] if score > best_score else best_direction + [direction]
-                    # revert the state_board
-                    self.move_snake(player, direction, False, state_board)
-                    if can_kill_rival:
-                        # restore the snake
-                        pass
-                    state_board[ny][nx] = previous
-
-                    can_kill_rival = can_kill_rival + kill
-                    if can_kill_rival:
-                        killed_rival = [(direction, can_kill_rival)] if not killed_rival else killed_rival + [(direction, can_kill_rival)]
-                    alpha = max(alpha, score)
-                    if alpha >= beta:
-                        break
-            if len(best_direction > 2) and killed_rival:
-                killed_rival.sort(key=lambda x: x[0])
-                for number_of_kill, direction in killed_rival:
-                    if direction in best_direction:
-                        return best_score, direction, number_of_kill
+    def get_score(self):
+        """
+        Leaf evaluation: my Voronoi territory (the grids I reach before every rival), then length advantage and
+        health, plus a bonus for owning a food that grows as my health drops
+        """
+        me = self.me
+        if not me.alive:
+            return -inf
+        rivals = [snake for snake in self.snakes if snake.alive and snake is not me]
+        heads = [(snake.body[0], snake.length) for snake in [me] + rivals]
+        owned, _, food = self.start.bitboard.voronoi(heads, self.occupied, self.food)
+        longest = max((snake.length for snake in rivals), default=0)
+        score = owned[0] + 2 * (me.length - longest) + me.health / 25
+        if food[0]:
+            score += (100 - me.health) / 25
+        return score
+
+    def rivals_killed(self):
+        return sum(1 for snake in self.snakes if not snake.alive and snake is not self.me)
+
+    def minimax(self, state_hash_value, depth, player, alpha, beta, following=()):
+        """
+        One round is my move followed by the reply of the rivals, see the search modes at the top
+        :param following: rivals that still move in this round after player, in paranoid mode
+        :return: (best_score, best_direction, number of rivals killed)
+        """
+        self.nodes += 1
+        if not self.nodes & self.check_mask:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchTimeout
+            if self.pacer is not None:
+                self.pacer.pace()  # raises SearchTimeout to cancel the search
+
+        key = state_hash_value ^ self.player_keys[player.id]
+        entry = self.table.probe(key)
+        table_move = entry[3] if entry is not None else None
+        if entry is not None and entry[1] >= depth:
+            score, _, bound, direction = entry
+            if bound == EXACT:
+                return score, direction, 0
+            if bound == LOWER:
+                alpha = max(alpha, score)
             else:
-                direction = random.choice(best_direction)
-                if killed_rival:
-                    number_of_kill, _ = list(filter(lambda x: x[1] == direction, killed_rival))[0]
-                    return best_score, direction, number_of_kill
-                else:
-                    return best_score, direction, 0
+                beta = min(beta, score)
+            if alpha >= beta:
+                return score, direction, 0
+        alpha_original, beta_original = alpha, beta
+
+        if depth == 0 or not self.me.alive:
+            score = self.get_score()
+            self.table.store(key, score, depth, EXACT)
+            return score, None, self.rivals_killed()
+
+        ply = self.root_depth - depth
+        moves = self.order_moves(player, ply, table_move)
+        if player is self.me:  # maximizing player
+            best_score, best_direction, killed_rival = -inf, None, 0
+            for i, (direction, cell) in enumerate(moves):
+                score, kill = self.score_move(state_hash_value, depth, cell, alpha, beta)
+                if best_direction is None or score > best_score or \
+                        (score == best_score and (kill > killed_rival or (kill == killed_rival and
+                                                  self.to_center(cell) < self.to_center(best_direction[1])))):
+                    best_score, best_direction, killed_rival = score, (direction, cell), kill
+                alpha = max(alpha, score)
+                if alpha >= beta:
+                    self.record_cutoff(player, ply, depth, direction, i)
+                    break
+            result = best_score, best_direction[0] if best_direction else None, killed_rival
 
         else:  # minimizing player
-            best_score, best_direction, killed_rival = inf, None, False
-            for direction, ny, nx in self.start.get_neighbors(player["head"]['y'], player["head"]['x']):
-                pass
+            best_score, best_direction, killed_rival = inf, None, 0
+            next_player, rest = self.next_player(following)  # a rival's move can only kill me or itself
+            for i, (direction, cell) in enumerate(moves):
+                new_hash_value, undo = self.make_move(player, cell, state_hash_value)
+                if next_player is self.me:
+                    new_hash_value, round_undo = self.end_round(new_hash_value)
+                score, _, kill = self.minimax(new_hash_value, depth - 1, next_player, alpha, beta, rest)
+                if next_player is self.me:
+                    self.unmake_move(round_undo)
+                self.unmake_move(undo)
+                if best_direction is None or score < best_score or (score == best_score and kill < killed_rival):
+                    best_score, best_direction, killed_rival = score, direction, kill
+                beta = min(beta, score)
+                if alpha >= beta:
+                    self.record_cutoff(player, ply, depth, direction, i)
+                    break
+            if best_direction is None:  # no way out, the rival dies
+                changes, heads = [], []
+                new_hash_value = self.remove_snake(player, state_hash_value, changes, heads)
+                if next_player is self.me:
+                    new_hash_value, round_undo = self.end_round(new_hash_value)
+                best_score, _, killed_rival = self.minimax(new_hash_value, depth - 1, next_player, alpha, beta, rest)
+                if next_player is self.me:
+                    self.unmake_move(round_undo)
+                self.unmake_move((player, player.health, player.length, False, None, changes, heads, [player], None))
+            result = best_score, best_direction, killed_rival
+
+        self.store(key, depth, result, alpha_original, beta_original)
+        return result
+
+    def order_moves(self, player, ply, table_move):
+        """
+        :return: [(direction, cell)] of the moves that are not dead ends: the transposition table's best move first,
+            then the killer moves of this ply, then the others by history score
+        """
+        cell = player.body[0]
+        killers = self.killers.get((ply, player.id), ())
+        history = self.history
+        moves = [(direction, to_cell) for direction, to_cell in self.neighbors[cell]
+                 if not self.is_dead_end(player, to_cell)]
+        if len(moves) > 1:
+            moves.sort(key=lambda move: (move[0] == table_move, move[0] in killers,
+                                         history.get((player.id, cell, move[0]), 0)), reverse=True)
+        return moves
+
+    def record_cutoff(self, player, ply, depth, direction, index):
+        """
+        :param index: position of the move in the ordered moves
+        """
+        self.cutoffs += 1
+        if index == 0:
+            self.first_cutoffs += 1
+        key = (ply, player.id)
+        killers = self.killers.get(key)
+        if killers is None:
+            self.killers[key] = [direction]
+        elif killers[0] != direction:
+            self.killers[key] = [direction, killers[0]]
+        key = (player.id, player.body[0], direction)
+        self.history[key] = self.history.get(key, 0) + depth * depth
 
-    def best_move(self):
-        _, best_direction, _ = self.minimax(self.zobristHash(), 13, self.start.me, -inf, inf)
+    def age_history(self):
+        # Halve the history scores at every turn, so the cutoffs of the former turns weigh less
+        for key in self.history:
+            self.history[key] >>= 1
+
+    def first_cutoff_rate(self):
+        return self.first_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def score_move(self, state_hash_value, depth, to_cell, alpha, beta):
+        """
+        My move to the grid to_cell followed by the worst reply of the rivals, searched depth - 1 plies below my move
+        :return: (score, number of rivals killed)
+        """
+        new_hash_value, undo = self.make_move(self.me, to_cell, state_hash_value)
+        rivals = self.moving_rivals(depth) if depth > 1 and self.me.alive else []
+        if not rivals:
+            round_hash_value, round_undo = self.end_round(new_hash_value)
+            score, _, kill = self.minimax(round_hash_value, depth - 1, self.me, alpha, beta)
+            self.unmake_move(round_undo)
+        elif self.mode == PARANOID:
+            score, _, kill = self.minimax(new_hash_value, depth - 1, rivals[0], alpha, beta, tuple(rivals[1:]))
+        else:
+            score, kill = inf, 0
+            for snake in rivals:
+                this_score, _, this_kill = self.minimax(new_hash_value, depth - 1, snake, alpha, min(beta, score))
+                if this_score < score or (this_score == score and this_kill < kill):
+                    score, kill = this_score, this_kill
+                if score <= alpha:
+                    break
+        self.unmake_move(undo)
+        return score, kill
+
+    def moving_rivals(self, depth):
+        """
+        Called after my move, depth is the depth of my move
+        :return: the rivals alive that can reach a grid next to my head within depth plies, every rival if not pruning
+        """
+        rivals = [snake for snake in self.snakes if snake.alive and snake is not self.me]
+        if self.prune:
+            y, x = divmod(self.me.body[0], self.start.width)
+            rivals = [snake for snake in rivals if self.distance(snake.body[0], y, x) <= depth]
+        return rivals
+
+    def next_player(self, following):
+        """
+        :return: (player, rivals after it) of the next move in the round, me when every rival has moved
+        """
+        for i, snake in enumerate(following):
+            if snake.alive:
+                return snake, following[i + 1:]
+        return self.me, ()
+
+    def distance(self, cell, y, x):
+        Y, X = divmod(cell, self.start.width)
+        return abs(Y - y) + abs(X - x)
+
+    def legal_moves(self):
+        """
+        :return: [(direction, cell)] of my moves that are not dead ends
+        """
+        return [(direction, cell) for direction, cell in self.neighbors[self.me.body[0]]
+                if not self.is_dead_end(self.me, cell)]
+
+    def start_search(self, deadline):
+        self.deadline = deadline
+        self.nodes = 0
+        self.depth_reached = 0
+        self.best_score = None
+        self.killers = {}
+        self.cutoffs = self.first_cutoffs = 0
+        self.age_history()
+        self.reset()
+
+    def connectivity(self):
+        # Connectivity of the current position, with the time every body grid frees up
+        return Connectivity(self.start.width, self.start.height, self.occupied,
+                            get_vacate_times([snake.body for snake in self.snakes if snake.alive], len(self.board)))
+
+    def find_traps(self):
+        """
+        :return: the grids of my legal moves that are traps for my length, none if every move is one
+        """
+        moves = self.legal_moves()
+        if len(moves) < 2:
+            return set()
+        connectivity = self.connectivity()
+        traps = set(cell for _, cell in moves if connectivity.is_trap(cell, self.me.length))
+        return traps if len(traps) < len(moves) else set()
+
+    def search_move(self, direction, deadline=None, max_depth=13):
+        """
+        Iterative deepening below one of my moves, the unit of work of the parallel root search
+        :return: [(score, kills) of depth 1, depth 2, ...], one entry per completed iteration
+        """
+        self.start_search(deadline)
+        hash_value = self.zobristHash()
+        results = []
+        for move, cell in self.legal_moves():
+            if move != direction:
+                continue
+            for depth in range(1, max_depth + 1):
+                self.root_depth = depth
+                try:
+                    results.append(self.score_move(hash_value, depth, cell, -inf, inf))
+                except SearchTimeout:
+                    break
+                self.depth_reached = depth
+                if results[-1][0] == -inf:
+                    break
+        return results
+
+    def to_center(self, cell):
+        y, x = divmod(cell, self.start.width)
+        return abs(2 * y - self.start.height + 1) + abs(2 * x - self.start.width + 1)
+
+    def store(self, key, depth, result, alpha, beta):
+        """
+        :param alpha, beta: the window this node was searched with
+        """
+        score, direction = result[0], result[1]
+        if score <= alpha:
+            bound = UPPER
+        elif score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.store(key, score, depth, bound, direction)
+
+    def best_move(self, deadline=None, max_depth=13):
+        """
+        Iterative deepening: search depth 1, 2, 3, ... until max_depth or until the deadline passes
+        :param deadline: time.perf_counter() value, None to always finish max_depth
+        :return: best direction of the deepest completed iteration, None if not even depth 1 is completed
+        """
+        self.start_search(deadline)
+        hash_value = self.zobristHash()
+        best_direction = None
+        for depth in range(1, max_depth + 1):
+            self.root_depth = depth
+            try:
+                score, direction, _ = self.minimax(hash_value, depth, self.me, -inf, inf)
+            except SearchTimeout:
+                break
+            if score == -inf and best_direction is not None:
+                break  # every move loses at this depth, keep the move that survives longest
+            best_direction = direction
+            self.best_score = score
+            self.depth_reached = depth
+            if score == -inf:
+                break
         return best_direction
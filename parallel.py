@@ -0,0 +1,94 @@
+"""
+Parallel root search for Minimax
+    - each of my (up to four) candidate moves is searched by its own worker process with iterative deepening
+    - the worker processes are forked once when the server starts, so no process is spawned per move
+    - every worker keeps its own per-game sessions, so its transposition tables are reused across turns
+    - the tasks carry an absolute time.monotonic() deadline, the same clock in every process: with more moves than
+      workers the moves are searched in waves that share the time, a task picked up after its deadline is skipped
+"""
+
+import multiprocessing
+import os
+import time
+from math import inf
+
+from minimax import Minimax
+from session import SessionStore
+
+worker_sessions = None  # SessionStore of the worker process
+
+
+def init_worker(ttl, max_sessions, table_megabytes):
+    global worker_sessions
+    worker_sessions = SessionStore(ttl, max_sessions, table_megabytes)
+
+
+def search_move(data, direction, deadline, max_depth, mode):
+    """
+    Runs in a worker process
+    :param deadline: time.monotonic() value at which the result must be sent back
+    :return: (direction, scores), no scores if the task was picked up too late
+    """
+    budget = deadline - time.monotonic()
+    if budget <= 0:
+        return direction, []  # stale, e.g. queued behind the tasks of other games
+    search = Minimax(data["board"], data["you"], worker_sessions.get(data), mode)
+    search.check_mask = 0x1F  # stop within the grace time of the deadline
+    return direction, search.search_move(direction, time.perf_counter() + budget, max_depth)
+
+
+class ParallelSearch:
+    def __init__(self, workers=None, ttl=300, max_sessions=64, table_megabytes=8):
+        """
+        :param workers: number of worker processes, one per CPU core by default
+        :param ttl, max_sessions, table_megabytes: settings of the sessions kept by every worker, see SessionStore
+        """
+        self.workers = workers or os.cpu_count()
+        self.pool = multiprocessing.Pool(self.workers, init_worker, (ttl, max_sessions, table_megabytes))
+
+    def best_move(self, data, deadline, max_depth=32, grace=0.01, mode=None):
+        """
+        :param deadline: time.perf_counter() value at which the move must be chosen
+        :param mode: search mode of Minimax, see minimax.py
+        :param grace: seconds kept to collect the results, the workers stop that much before the deadline. It is
+            multiplied by the workers sharing a core, a worker waiting for the CPU sees the deadline late
+        :return: best direction at the deepest depth completed for every move, None if a move has no result
+        """
+        search = Minimax(data["board"], data["you"], table=False)
+        moves = dict(search.legal_moves())  # direction -> grid
+        if len(moves) == 1:
+            return next(iter(moves))
+        # The workers stop the grace time before the deadline to send the results back. With more moves than
+        # workers, the moves of a wave get the next share of the time
+        grace *= -(-self.workers // (os.cpu_count() or 1))
+        budget = max(deadline - time.perf_counter() - grace, 0)
+        start, waves = time.monotonic(), -(-len(moves) // self.workers)
+        tasks = [self.pool.apply_async(search_move, (data, direction, start + budget * (i // self.workers + 1) / waves,
+                                                     max_depth, mode))
+                 for i, direction in enumerate(moves)]
+
+        results = {}
+        for task in tasks:
+            try:
+                direction, scores = task.get(timeout=max(deadline - time.perf_counter(), 0))
+            except multiprocessing.TimeoutError:
+                return None  # a move without a result might be the best one
+            if not scores:
+                return None
+            results[direction] = scores
+
+        # Compare the moves at the deepest depth every one of them completed, a lost move stays lost deeper
+        depth = min(len(scores) if scores[-1][0] > -inf else max_depth for scores in results.values())
+        best_score, best_direction, killed_rival = -inf, None, 0
+        for direction, scores in results.items():
+            score, kill = scores[min(depth, len(scores)) - 1]
+            if best_direction is None or score > best_score or \
+                    (score == best_score and (kill > killed_rival or (kill == killed_rival and
+                                              search.to_center(moves[direction]) <
+                                              search.to_center(moves[best_direction])))):
+                best_score, best_direction, killed_rival = score, direction, kill
+        return best_direction
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
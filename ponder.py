@@ -0,0 +1,157 @@
+"""
+Pondering: searching the next turn of a game while waiting for its /move
+    - after a move is sent, the positions after the most plausible replies of the rivals are searched into the
+      transposition table of the game, so the next /move starts from warm entries
+    - one background thread per process ponders the last game that moved
+    - a /move of the game being pondered cancels the pondering, a /move of any other game pauses it
+    - the pondering thread sleeps to use at most a share cpu of one core, it never runs while a /move is answered
+"""
+
+import threading
+import time
+from math import inf
+
+from minimax import Minimax, SearchTimeout
+
+
+class Ponderer:
+    def __init__(self, cpu=0.5, positions=8, max_depth=32, period=0.01, grace=0.05):
+        """
+        :param cpu: share of one core used by pondering, between 0 and 1
+        :param positions: positions after the rivals' replies that are searched
+        :param period: seconds of pondering between two sleeps
+        :param grace: seconds a /move waits for the cancelled pondering to let go of the transposition table
+        """
+        self.cpu = cpu
+        self.positions = positions
+        self.max_depth = max_depth
+        self.period = period
+        self.grace = grace
+        self.condition = threading.Condition()
+        self.job = None  # (data, direction, session) waiting to be pondered, only the last one is kept
+        self.session = None  # session being pondered
+        self.cancelled = False
+        self.live = 0  # /move requests being answered
+        self.awake = 0.0  # time.perf_counter() value when the pondering last woke up
+        self.nodes = 0  # nodes pondered since the start
+        self.thread = threading.Thread(target=self.run, name="ponder", daemon=True)
+        self.thread.start()
+
+    def submit(self, data, direction, session):
+        """
+        Ponders the position of data after my move direction, replaces the job waiting if any
+        """
+        with self.condition:
+            self.job = (data, direction, session)
+            self.condition.notify_all()
+
+    def enter(self, session):
+        """
+        Called when a /move arrives, before its search. Returns when the pondering of its game is stopped
+        """
+        with self.condition:
+            self.live += 1
+            self.cancel(session)
+
+    def leave(self):
+        # Called when a /move is answered
+        with self.condition:
+            self.live -= 1
+            self.condition.notify_all()
+
+    def cancel(self, session):
+        """
+        Drops the pondering of the session, e.g. on /end. Must be called with self.condition held
+        """
+        if self.job is not None and self.job[2] is session:
+            self.job = None
+        if self.session is session:
+            self.cancelled = True
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: self.session is not session, self.grace)
+
+    def pace(self):
+        """
+        Called by the search every few nodes: stops it when cancelled, pauses it while a /move is answered and
+        sleeps to keep the CPU share
+        """
+        if self.cancelled:
+            raise SearchTimeout
+        now = time.perf_counter()
+        if not self.live and now - self.awake < self.period:
+            return
+        with self.condition:
+            self.condition.wait_for(lambda: self.cancelled or not self.live)
+            if not self.cancelled and self.cpu < 1:
+                self.condition.wait((now - self.awake) * (1 - self.cpu) / self.cpu)
+            if self.cancelled:
+                raise SearchTimeout
+        self.awake = time.perf_counter()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.job is not None)
+                data, direction, session = self.job
+                self.job = None
+                self.session, self.cancelled = session, False
+            try:
+                self.ponder(data, direction, session)
+            except SearchTimeout:
+                pass
+            finally:
+                with self.condition:
+                    self.session = None
+                    self.condition.notify_all()
+
+    def ponder(self, data, direction, session):
+        """
+        Searches the predicted positions one depth at a time, so every position gets a share of the time,
+        until max_depth or until cancelled
+        """
+        self.awake = time.perf_counter()
+        search = Minimax(data["board"], data["you"], session)
+        search.check_mask = 0x1F  # answer a cancel within a few ms
+        search.pacer = self  # no start_search(): the history is aged once per turn, by the search of /move
+        moves = dict(search.legal_moves())
+        if direction not in moves:
+            return
+        hash_value, _ = search.make_move(search.me, moves[direction], search.zobristHash())
+        if not search.me.alive:
+            return
+        replies = self.plausible_replies(search)
+        for depth in range(1, self.max_depth + 1):
+            search.root_depth = depth
+            for reply in replies:
+                value, undo = hash_value, []
+                for snake, cell in reply:
+                    if snake.alive:
+                        value, record = search.make_move(snake, cell, value)
+                        undo.append(record)
+                value, record = search.end_round(value)
+                undo.append(record)
+                if search.me.alive:
+                    nodes = search.nodes
+                    search.minimax(value, depth, search.me, -inf, inf)
+                    self.nodes += search.nodes - nodes
+                for record in reversed(undo):
+                    search.unmake_move(record)
+
+    def plausible_replies(self, search):
+        """
+        Every rival's moves are ranked by the space they leave it, all from one connectivity pass, the joint replies
+        with the lowest sum of ranks are kept, one rival at a time
+        :return: [[(snake, cell) of every rival]], at most self.positions of them
+        """
+        connectivity = search.connectivity()
+        replies = [(0, [])]  # (sum of ranks, moves)
+        for snake in search.snakes:
+            if not snake.alive or snake is search.me:
+                continue
+            cells = [cell for _, cell in search.neighbors[snake.body[0]] if not search.is_dead_end(snake, cell)]
+            if not cells:
+                continue  # the rival dies whatever it does
+            cells.sort(key=lambda cell: -connectivity.space(cell))
+            replies = sorted(((rank + i, moves + [(snake, cell)]) for rank, moves in replies
+                              for i, cell in enumerate(cells)), key=lambda reply: reply[0])[:self.positions]
+        return [moves for _, moves in replies]
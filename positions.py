@@ -0,0 +1,127 @@
+"""
+Position cache on disk, answers known positions without searching
+    - fixed-width records (Zobrist hash, score, depth, best move) sorted by hash, after a 16 byte header
+    - opened through mmap and searched by bisection, only the probed records are unpacked
+    - the hash is Minimax.zobristHash() with me to move, the Zobrist keys are seeded so it is stable across runs
+    - built offline from self-play or from saved /move bodies:
+        python positions.py --output positions.bin [--games 100] [--turns 12] [--boards boards.json] [--depth 6]
+"""
+
+import argparse
+import mmap
+import os
+import struct
+
+from transposition import DIRECTIONS, MOVE_INDEX
+
+MAGIC = b"NIDHOGG1"
+HEADER = struct.Struct("<8sQ")  # magic, number of records
+RECORD = struct.Struct("<QdBB")  # hash, score, depth, index in DIRECTIONS
+KEY = struct.Struct("<Q")
+
+
+class PositionCache:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or len(self.map) != HEADER.size + self.count * RECORD.size:
+            self.close()
+            raise ValueError("%s is not a position cache" % path)
+
+    def __len__(self):
+        return self.count
+
+    def probe(self, hash_value):
+        """
+        :return: (score, depth, move) or None if the position is not stored
+        """
+        data, unpack = self.map, KEY.unpack_from
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) >> 1
+            if unpack(data, HEADER.size + middle * RECORD.size)[0] < hash_value:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            key, score, depth, move = RECORD.unpack_from(data, HEADER.size + low * RECORD.size)
+            if key == hash_value:
+                return score, depth, DIRECTIONS[move]
+        return None
+
+    def records(self):
+        # Yield every (hash, score, depth, move)
+        for i in range(self.count):
+            key, score, depth, move = RECORD.unpack_from(self.map, HEADER.size + i * RECORD.size)
+            yield key, score, depth, DIRECTIONS[move]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    @staticmethod
+    def write(path, records):
+        """
+        :param records: {hash: (score, depth, move)}
+        """
+        with open(path + ".tmp", 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(records)))
+            for key in sorted(records):
+                score, depth, move = records[key]
+                f.write(RECORD.pack(key, score, min(depth, 255), MOVE_INDEX[move]))
+        os.replace(path + ".tmp", path)
+
+
+def analyse(data, depth, records):
+    """
+    Searches the position of data["you"] to the fixed depth and keeps it in records if it is deeper than the known one
+    """
+    from minimax import Minimax
+
+    search = Minimax(data["board"], data["you"])
+    key = search.zobristHash()
+    known = records.get(key)
+    if known is not None and known[1] >= depth:
+        return
+    move = search.best_move(None, depth)
+    if move is not None and search.depth_reached == depth:  # a lost position ends the deepening early
+        records[key] = (search.best_score, depth, move)
+
+
+if __name__ == "__main__":
+    import corpus
+    from simulator import Game, weights_player
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default="positions.bin", help="merged with the records it already has")
+    parser.add_argument("--games", type=int, default=100, help="self-play games to take positions from")
+    parser.add_argument("--turns", type=int, default=12, help="opening turns kept from every game")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[11])
+    parser.add_argument("--snakes", type=int, nargs='+', default=[2, 4])
+    parser.add_argument("--boards", help="JSON list of /move bodies, e.g. past games or a corpus.py file")
+    parser.add_argument("--depth", type=int, default=6)
+    args = parser.parse_args()
+
+    records = {}
+    if os.path.exists(args.output):
+        cache = PositionCache(args.output)
+        records = {key: (score, depth, move) for key, score, depth, move in cache.records()}
+        cache.close()
+    if args.boards:
+        for data in corpus.load(args.boards):
+            analyse(data, args.depth, records)
+    seed = 0
+    for size in args.sizes:
+        for snakes in args.snakes:
+            for _ in range(args.games):
+                game = Game(size, size, snakes, seed)
+                seed += 1
+                players = [weights_player()] * snakes
+                while not game.is_over() and game.turn < args.turns:
+                    requests = game.requests()
+                    for data in requests.values():
+                        analyse(data, args.depth, records)
+                    game.step([players[i](requests[i]) if i in requests else None for i in range(snakes)])
+    PositionCache.write(args.output, records)
+    print("%d positions in %s" % (len(records), args.output))
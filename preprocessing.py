@@ -1,18 +1,163 @@
 from collections import deque
+import heapq
 import json
 
+from bitboard import Bitboard, get_masks
+from connectivity import Connectivity, get_vacate_times
+from hazards import Hazards
+
 INT_MIN, INT_MAX = -10 ** 3, 10 ** 3
+DIRECTIONS = ('up', 'down', 'left', 'right')
+COORDINATES = {
+    'up': (1, 0),  # (y, x)
+    'down': (-1, 0),
+    'left': (0, -1),
+    'right': (0, 1),
+}
+CORNER_WEIGHTS = ((7, 5, 4, 3), (5, 4, 3, 2), (4, 3, 2, 1))
+FOOD_REACH = 5  # get_food_weights() weighs the grids at most this many moves from a food
+
+neighbors_lookup = {}
+cell_neighbors_lookup = {}
+corner_lookup = {}
+reach_lookup = {}
+
+
+def get_neighbors_table(width, height, ordered_directions=DIRECTIONS):
+    """
+    Adjacency table shared by every Preprocessing and Minimax instance, built once per board size and direction order
+    :return: table[y * width + x] is the tuple of (direction, Y, X) around the grid (x, y)
+    """
+    key = (width, height, tuple(ordered_directions))
+    table = neighbors_lookup.get(key)
+    if table is None:
+        table = []
+        for y in range(height):
+            for x in range(width):
+                neighbors = []
+                for direction in key[2]:
+                    Y, X = y + COORDINATES[direction][0], x + COORDINATES[direction][1]
+                    if 0 <= Y < height and 0 <= X < width:
+                        neighbors.append((direction, Y, X))
+                table.append(tuple(neighbors))
+        table = tuple(table)
+        neighbors_lookup[key] = table
+    return table
+
+
+def get_cell_neighbors_table(width, height):
+    """
+    Same as get_neighbors_table() with flat grids, used by the search
+    :return: table[y * width + x] is the tuple of (direction, Y * width + X) around the grid (x, y)
+    """
+    table = cell_neighbors_lookup.get((width, height))
+    if table is None:
+        table = tuple(tuple((direction, Y * width + X) for direction, Y, X in neighbors)
+                      for neighbors in get_neighbors_table(width, height))
+        cell_neighbors_lookup[(width, height)] = table
+    return table
+
+
+def get_reach_masks(width, height, level):
+    """
+    Bitmasks of the grids within level moves, built once per board size and extended when a larger level is asked
+    :return: reach[k][y * width + x] is the bitmask of the grids at most k moves away from (x, y)
+    """
+    reach = reach_lookup.setdefault((width, height), [[1 << cell for cell in range(width * height)]])
+    full, not_left, not_right = get_masks(width, height)
+    while len(reach) <= level:
+        reach.append([((mask << width) | (mask >> width) | ((mask >> 1) & not_right) | ((mask << 1) & not_left) |
+                       mask) & full for mask in reach[-1]])
+    return reach
+
+
+def get_corner_weights(width, height, corner_weights=CORNER_WEIGHTS):
+    """
+    Weights of the area around walls, heavy on corners. Built once per board size, INT_MIN where there is no weight
+    :param corner_weights: corner_weights[i][j] for the grid i grids from a wall and j grids along it from a corner
+    :return: corner_weights[y][x]
+    """
+    weights = corner_lookup.get((width, height, corner_weights))
+    if weights is None:
+        weights = [[INT_MIN] * width for _ in range(height)]
+        for i in range(3):
+            for j in range(width):
+                for y, x in ((i, j), (i, width - 1 - j), (height - 1 - i, j), (height - 1 - i, width - 1 - j)):
+                    weights[y][x] = max(weights[y][x], corner_weights[i][min(3, j)])
+        for i in range(3):
+            for j in range(height):
+                for y, x in ((j, i), (j, width - 1 - i), (height - 1 - j, i), (height - 1 - j, width - 1 - i)):
+                    weights[y][x] = max(weights[y][x], corner_weights[i][min(3, j)])
+        corner_lookup[(width, height, corner_weights)] = weights
+    return weights
+
+
+class Coefficients:
+    """
+    Tunable numbers of get_weights(), the defaults are the hand-picked values
+    """
+    def __init__(self, health=(12, 36, 100), food=(1.6, 1.2, 1), rival_food=1.6, unit_weight=-6.4,
+                 food_falloff=1.6, food_offset=2.4, corners=CORNER_WEIGHTS, hazard=0.25):
+        self.health = tuple(health)  # upper bounds of my health, in increasing order
+        self.food = tuple(food)  # food coefficient when my health is at most the bound of the same index
+        self.rival_food = rival_food  # food coefficient when a rival has at least my health
+        self.unit_weight = unit_weight  # weight of a food grid, multiplied by the food coefficient
+        self.food_falloff = food_falloff  # a grid n + 1 moves from a food weighs unit_weight + n * falloff + offset
+        self.food_offset = food_offset
+        self.corners = tuple(tuple(row) for row in corners)  # see get_corner_weights()
+        self.hazard = hazard  # weight of a hazard grid per point of hazard damage
+
+    def to_dict(self):
+        return {name: [list(row) for row in value] if name == "corners" else
+                (list(value) if isinstance(value, tuple) else value) for name, value in vars(self).items()}
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+
+DEFAULT_COEFFICIENTS = Coefficients()
+
+
+def combine_weights(occupied, corner_weight, snake_weight, food_weight, hazard_weight=0):
+    # Weight of one grid after get_weights(), the layers are added in the same order and rounded the same way
+    weight = max(INT_MAX if occupied else 0, corner_weight)
+    if weight < INT_MAX:
+        weight = weight + float("{:.2f}".format(snake_weight))
+    if weight < INT_MAX:
+        weight = float("{:.1f}".format(weight + food_weight))
+    if weight < INT_MAX and hazard_weight:
+        weight = INT_MAX if hazard_weight >= INT_MAX else float("{:.1f}".format(weight + hazard_weight))
+    return weight
 
 
 class Preprocessing:
-    def __init__(self, board, me):  # board = data["board"], me = data["me"]
+    def __init__(self, board, me, coefficients=None, previous=None, hazards=None):
+        """
+        board = data["board"], me = data["me"]
+        :param previous: Preprocessing of the previous turn of the same game after get_weights(), its weights are
+            patched instead of rebuilt, None to build everything
+        :param hazards: Hazards of the game, kept across its turns, None to read board["hazards"] from scratch
+        """
         self.me = me
+        self.coefficients = coefficients or DEFAULT_COEFFICIENTS
         self.height = board["height"]
         self.width = board["width"]
         self.food = board["food"]
         self.snakes = board["snakes"]
-        # self.hazards = board["hazards"]
-        self.board = self.init_board()
+        self.hazards = hazards or Hazards(board["width"], board["height"])
+        self.hazards.update(board.get("hazards") or [])
+        self.neighbors = get_neighbors_table(self.width, self.height)
+        # self.neighbors[y * self.width + x] is the same as self.get_neighbors(y, x)
+        self.previous = previous
+        self.board = self.init_board()  # a few microseconds, cheaper than patching the previous board
+        self.bitboard = Bitboard.from_grid(self.board, self.width, self.height)
+        # Same information as self.board, one Python int per layer. Used by get_space() and get_distance_layers()
 
         self.distance = [[-1] * self.width for _ in range(self.height)]
         """
@@ -27,11 +172,18 @@ class Preprocessing:
         """
         self.weights can be modified by get_weights(), avoid_corners(), avoid_snakes(), attack_rivals() and detect_food()
         """
+        self.snake_weights = None  # layer of avoid_snakes(), kept to patch the weights of the next turn
+        self.food_weights = None  # layer of detect_food(), same
+        self.hazard_weights = None  # layer of avoid_hazards(), None on a board without hazards
+        self.horizon = None  # grids weighted by the lazy mode of get_weights(), None when every grid is weighted
+        self.lazy = None  # layers of the lazy mode, see init_lazy_weights()
+        self.window = None  # (radius, snake layer of the grids within radius moves of my head), see spread_window()
 
     def init_board(self):
         """
         We use number to denote different items on the board.
         0 for empty, 1 for (mine and rival snakes') body, 2 for rivals' head, 3 for my head, 4 for food
+        Hazards lie under the other items, they are the separate layer self.hazards
 
         The Y-Axis is positive in the up direction, and X-Axis is positive to the right
         """
@@ -51,20 +203,8 @@ class Preprocessing:
 
     def get_neighbors(self, y, x, ordered_directions=None):
         if ordered_directions is None:
-            ordered_directions = ['up', 'down', 'left', 'right']
-        coordinates = {
-            'up': {'x': 0, 'y': 1},
-            'down': {'x': 0, 'y': -1},
-            'left': {'x': -1, 'y': 0},
-            'right': {'x': 1, 'y': 0},
-        }
-        neighbors = []
-        for direction in ordered_directions:
-            Y = y + coordinates[direction]['y']
-            X = x + coordinates[direction]['x']
-            if 0 <= Y < self.height and 0 <= X < self.width:
-                neighbors.append((direction, Y, X))
-        return neighbors
+            return self.neighbors[y * self.width + x]
+        return get_neighbors_table(self.width, self.height, ordered_directions)[y * self.width + x]
 
     def get_distance(self, y, x, ordered_directions=None):
         # Strategy: BFS, FloodFill
@@ -72,10 +212,13 @@ class Preprocessing:
         self.direction = [[None] * self.width for _ in range(self.height)]
         space = 0
         if ordered_directions is None:
-            ordered_directions = ['up', 'down', 'left', 'right']
+            neighbors = self.neighbors
+        else:
+            neighbors = get_neighbors_table(self.width, self.height, ordered_directions)
+        width = self.width
         self.distance[y][x] = 0
         queue = deque()
-        for direction, ny, nx in self.get_neighbors(y, x, ordered_directions):
+        for direction, ny, nx in neighbors[y * width + x]:
             self.distance[ny][nx] = 1
             self.direction[ny][nx] = direction
             if self.board[ny][nx] == 0 or self.board[ny][nx] == 4:
@@ -83,7 +226,7 @@ class Preprocessing:
         while queue:
             y, x = queue.popleft()
             space += 1
-            for _, ny, nx in self.get_neighbors(y, x, ordered_directions):
+            for _, ny, nx in neighbors[y * width + x]:
                 if self.distance[ny][nx] == -1:
                     self.distance[ny][nx] = self.distance[y][x] + 1
                     self.direction[ny][nx] = self.direction[y][x]
@@ -91,10 +234,68 @@ class Preprocessing:
                         queue.append((ny, nx))
         return space
 
+    def project_health(self, y, x, health):
+        """
+        Cost-aware version of get_distance(): a move costs 1 health, 1 + hazard damage onto a hazard, and food heals
+        :return: projection[y][x] is the most health left when I arrive on the grid (x, y), 0 if I arrive dead,
+            -1 if unreachable. Dead grids are not expanded
+        """
+        projection = [[-1] * self.width for _ in range(self.height)]
+        projection[y][x] = health
+        queue = [(-health, y, x)]
+        while queue:
+            left, y, x = heapq.heappop(queue)
+            if -left < projection[y][x]:
+                continue
+            for _, ny, nx in self.neighbors[y * self.width + x]:
+                value = self.board[ny][nx]
+                if 1 <= value <= 3:
+                    continue
+                arrival = 100 if value == 4 else max(-left - self.hazards.cost(ny, nx), 0)
+                if arrival > projection[ny][nx]:
+                    projection[ny][nx] = arrival
+                    if arrival:
+                        heapq.heappush(queue, (-arrival, ny, nx))
+        return projection
+
+    def get_space(self, y, x):
+        """
+        Bit-parallel version of get_distance(): only returns the space, does not fill self.distance
+        """
+        return self.bitboard.get_space(y, x)
+
+    def safest_move(self):
+        """
+        Cheap move that does not need self.weights: the free neighbor of my head that is not a trap, with the most
+        space, from one connectivity pass
+        :return: direction, "up" if every neighbor is taken
+        """
+        width = self.width
+        bodies = [[body['y'] * width + body['x'] for body in snake["body"]] for snake in self.snakes]
+        connectivity = Connectivity(width, self.height, self.bitboard.occupied,
+                                    get_vacate_times(bodies, width * self.height))
+        head = self.me["head"]
+        move, best = "up", None
+        for direction, ny, nx in self.neighbors[head['y'] * width + head['x']]:
+            if not 1 <= self.board[ny][nx] <= 3:
+                cell = ny * width + nx
+                key = (not connectivity.is_trap(cell, self.me["length"]), connectivity.space(cell))
+                if best is None or key > best:
+                    move, best = direction, key
+        return move
+
+    def get_distance_layers(self, y, x):
+        """
+        :return: (space, layers), layers[k] is the set of grids (y, x) with self.distance[y][x] == k
+        after get_distance(y, x) is called
+        """
+        space, layers = self.bitboard.flood_fill(y, x)
+        return space, [list(self.bitboard.cells(layer)) for layer in layers]
+
     def closest_food(self, allowed_direction=None):
         if allowed_direction is None:
             allowed_direction = []
-        ordered_directions = allowed_direction + [i for i in ['up', 'down', 'left', 'right'] if
+        ordered_directions = allowed_direction + [i for i in DIRECTIONS if
                                                   i not in allowed_direction]
         self.get_distance(y=self.me["head"]["y"], x=self.me["head"]["x"], ordered_directions=ordered_directions)
         distance = 122
@@ -115,51 +316,32 @@ class Preprocessing:
 
     def avoid_corners(self):
         # Add weights to area around walls. Assign heavy weight to corners
-        corner_weights = [[7, 5, 4, 3], [5, 4, 3, 2], [4, 3, 2, 1]]
-        for i in range(3):
+        corner_weights = get_corner_weights(self.width, self.height, self.coefficients.corners)
+        for i in range(self.height):
             for j in range(self.width):
-                self.weights[i][j] = max(self.weights[i][j], corner_weights[i][min(3, j)])
-                self.weights[i][self.width - 1 - j] = max(self.weights[i][self.width - 1 - j],
-                                                          corner_weights[i][min(3, j)])
-                self.weights[self.height - 1 - i][j] = max(self.weights[self.height - 1 - i][j],
-                                                           corner_weights[i][min(3, j)])
-                self.weights[self.height - 1 - i][self.width - 1 - j] = max(
-                    self.weights[self.height - 1 - i][self.width - 1 - j],
-                    corner_weights[i][min(3, j)])
-        for i in range(3):
-            for j in range(self.height):
-                self.weights[j][i] = max(self.weights[j][i], corner_weights[i][min(3, j)])
-                self.weights[j][self.width - 1 - i] = max(self.weights[j][self.width - 1 - i],
-                                                          corner_weights[i][min(3, j)])
-                self.weights[self.height - 1 - j][i] = max(self.weights[self.height - 1 - j][i],
-                                                           corner_weights[i][min(3, j)])
-                self.weights[self.height - 1 - j][self.width - 1 - i] = max(
-                    self.weights[self.height - 1 - j][self.width - 1 - i],
-                    corner_weights[i][min(3, j)])
+                self.weights[i][j] = max(self.weights[i][j], corner_weights[i][j])
 
     def avoid_snakes(self):
+        self.snake_weights = snake_weights = self.get_snake_weights()
+        for i in range(self.height):
+            for j in range(self.width):
+                self.weights[i][j] = self.weights[i][j] + float("{:.2f}".format(snake_weights[i][j])) \
+                    if self.weights[i][j] < INT_MAX else self.weights[i][j]
+
+    def get_snake_weights(self):
         snake_weights = [[0] * self.width for _ in range(self.height)]
-        queue = deque()
-        last, level, flag = None, 0, 0
+        width, neighbors = self.width, self.neighbors
         for snake in self.snakes:
             if snake["head"] != self.me["head"] and snake["length"] >= self.me["length"]:
-                snake_next_move = self.get_neighbors(snake["head"]['y'], snake["head"]['x'])
+                snake_next_move = neighbors[snake["head"]['y'] * width + snake["head"]['x']]
                 for _, y, x in snake_next_move:  # area around head is the most dangerous
                     snake_weights[y][x] += 4
-            for body in snake["body"][:-1]:
-                queue.append((0, body['y'], body['x']))
-                last = (body['y'], body['x'])
-
-        while queue and level < 2 and not flag:
-            level, y, x = queue.popleft()
-            flag = ((y, x) == last)
-            for _, ny, nx in self.get_neighbors(y, x, ['up', 'left']):
-                snake_weights[ny][nx] += max(2 - level, 0)
-                if flag == 1:
-                    last = (ny, nx)
-                    flag = 0
-                if self.weights[ny][nx] < INT_MAX: queue.append((level + 1, ny, nx))
+        self.spread_from_bodies(snake_weights, ('up', 'left'))
+        self.spread_from_bodies(snake_weights, ('down', 'right'))
+        return snake_weights
 
+    def spread_from_bodies(self, snake_weights, ordered_directions):
+        # Weight 2 next to every body, 1 for the grids two moves away, only towards ordered_directions
         queue = deque()
         last, level, flag = None, 0, 0
         for snake in self.snakes:
@@ -167,30 +349,39 @@ class Preprocessing:
                 queue.append((0, body['y'], body['x']))
                 last = (body['y'], body['x'])
 
+        width = self.width
+        neighbors = get_neighbors_table(self.width, self.height, ordered_directions)
         while queue and level < 2 and not flag:
             level, y, x = queue.popleft()
             flag = ((y, x) == last)
-            for _, ny, nx in self.get_neighbors(y, x, ['down', 'right']):
+            for _, ny, nx in neighbors[y * width + x]:
                 snake_weights[ny][nx] += max(2 - level, 0)
                 if flag == 1:
                     last = (ny, nx)
                     flag = 0
-                if self.weights[ny][nx] < INT_MAX: queue.append((level + 1, ny, nx))
+                if not 1 <= self.board[ny][nx] <= 3: queue.append((level + 1, ny, nx))
 
+    def detect_food(self, coef):
+        self.food_weights = food_weights = self.get_food_weights(coef)
         for i in range(self.height):
             for j in range(self.width):
-                self.weights[i][j] = self.weights[i][j] + float("{:.2f}".format(snake_weights[i][j])) \
+                self.weights[i][j] = float("{:.1f}".format(self.weights[i][j] + food_weights[i][j])) \
                     if self.weights[i][j] < INT_MAX else self.weights[i][j]
 
-    def detect_food(self, coef):
-        unit_weight = -6.4 * coef
+    def get_food_weights(self, coef, foods=None):
+        """
+        :param foods: the food spread, self.food by default
+        """
+        unit_weight = self.coefficients.unit_weight * coef
+        falloff, offset = self.coefficients.food_falloff, self.coefficients.food_offset
         food_weights = [[0] * self.width for _ in range(self.height)]
+        width, neighbors = self.width, self.neighbors
         last, level, flag = None, 0, 0
         queue = deque()
-        for food in self.food:
+        for food in self.food if foods is None else foods:
             y, x = food['y'], food['x']
             if self.me["health"] > 6:  # when not desperate for food
-                rival_goal = self.get_neighbors(y, x)
+                rival_goal = neighbors[y * width + x]
                 for _, ny, nx in rival_goal:  # if the food is reachable by a rival in one move, then ignore it
                     if self.board[ny][nx] == 2:
                         flag = 1
@@ -202,30 +393,69 @@ class Preprocessing:
         while queue and level < 4 and not flag:
             level, y, x = queue.popleft()
             flag = ((y, x) == last)
-            for _, ny, nx in self.get_neighbors(y, x):
-                if unit_weight + (level * 1.6 + 2.4) < food_weights[ny][nx]:
-                    food_weights[ny][nx] = unit_weight + (level * 1.6 + 2.4)
+            for _, ny, nx in neighbors[y * width + x]:
+                if unit_weight + (level * falloff + offset) < food_weights[ny][nx]:
+                    food_weights[ny][nx] = unit_weight + (level * falloff + offset)
                     queue.append((level + 1, ny, nx))
                     if flag == 1:
                         last = (ny, nx)
                         flag = 0
+        return food_weights
+
+    def avoid_hazards(self):
+        self.hazard_weights = hazard_weights = self.get_hazard_weights()
+        if hazard_weights is None:
+            return
         for i in range(self.height):
             for j in range(self.width):
-                self.weights[i][j] = float("{:.1f}".format(self.weights[i][j] + food_weights[i][j])) \
-                    if self.weights[i][j] < INT_MAX else self.weights[i][j]
+                if hazard_weights[i][j] and self.weights[i][j] < INT_MAX:
+                    self.weights[i][j] = INT_MAX if hazard_weights[i][j] >= INT_MAX else \
+                        float("{:.1f}".format(self.weights[i][j] + hazard_weights[i][j]))
+
+    def get_hazard_weights(self):
+        """
+        Hazard grids weigh coefficients.hazard per point of damage. A grid where the projected health runs out, see
+        project_health(), is as blocked as a body
+        :return: the layer, None on a board without hazards
+        """
+        if self.hazards.grid is None:
+            return None
+        shared = hazard_weights = self.hazards.weights(self.coefficients.hazard * self.hazards.damage)
+        head = self.me["head"]
+        projection = self.project_health(head['y'], head['x'], self.me["health"])
+        for i, row in enumerate(projection):
+            if 0 in row:
+                if hazard_weights is shared:
+                    hazard_weights = list(shared)  # the rows of the layer are shared by the turns, copy the list
+                hazard_weights[i] = [INT_MAX if arrival == 0 else weight
+                                     for arrival, weight in zip(row, hazard_weights[i])]
+        return hazard_weights
 
     def attack_rivals(self):  # attack and defend
         pass
 
-    def get_weights(self):
+    def get_weights(self, horizon=None, exact=True):
         """
         Passive/Defensive Strategy:
             1. Must call avoid_corners() first
             2. Call avoid_snakes()
             3. Call detect_food()
-            4. Call attack_rivals()
-
+            4. Call avoid_hazards()
+            5. Call attack_rivals()
+        With the previous turn, only the grids that changed are weighted again, see update_weights()
+        :param horizon: None for every grid, else the lazy mode: only the grids within horizon moves of my head are
+            weighted, the others stay None until weigh() is called, see init_lazy_weights()
+        :param exact: False for the approximate lazy mode, see init_lazy_weights()
         """
+        if horizon is not None:
+            self.previous = None  # the lazy mode keeps no layer to patch
+            self.init_lazy_weights(horizon, exact)
+            self.weigh_window(horizon)
+            return
+        previous = self.previous_weights()
+        if previous is not None:
+            self.update_weights(previous)
+            return
         for i in range(self.height):
             for j in range(self.width):
                 if 1 <= self.board[i][j] <= 3:
@@ -233,64 +463,297 @@ class Preprocessing:
 
         self.avoid_corners()
         self.avoid_snakes()
+        self.detect_food(self.food_coefficient())
+        self.avoid_hazards()
+
+        # self.attack_rivals()
+
+    def init_lazy_weights(self, horizon, exact=True):
+        """
+        Lazy mode of get_weights(): a grid is weighted on demand by weigh() with combine_weights(), so it gets the
+        weight of get_weights(). The food and hazard layers are spread over the whole board, their early stops depend
+        on the order of the whole queue, but they only visit the grids around the food. The snake layer is spread from
+        the bodies near the window, see spread_window(), unless a body or its neighbor is on a corner where
+        spread_from_bodies() may stop early, then it is spread over the whole board
+        Approximate mode, exact=False: only the food within horizon + FOOD_REACH moves of my head is spread, the
+        farther food cannot weigh the window but can change where the spreading stops, and the early stop of the snake
+        layer on the corners is ignored
+        """
+        self.weights = [[None] * self.width for _ in range(self.height)]
+        self.horizon = -1  # every grid within horizon moves of my head is weighted
+        self.window = None
+        counts = {}  # counts[(y, x)] is the number of body grids spread by spread_from_bodies() there
+        for snake in self.snakes:
+            for body in snake["body"][:-1]:
+                counts[(body['y'], body['x'])] = counts.get((body['y'], body['x']), 0) + 1
+        heads = {}  # weights next to the heads of the rivals as long as me, see get_snake_weights()
+        for snake in self.snakes:
+            if snake["head"] != self.me["head"] and snake["length"] >= self.me["length"]:
+                for _, y, x in self.neighbors[snake["head"]['y'] * self.width + snake["head"]['x']]:
+                    heads[(y, x)] = heads.get((y, x), 0) + 4
+        snake_weights = None
+        corners = ((('up', 'left'), (self.height - 1, 0)), (('down', 'right'), (0, self.width - 1))) if exact else ()
+        for directions, (y, x) in corners:
+            # no neighbor towards the directions, see VectorizedPreprocessing.snake_layer()
+            if (y, x) in counts or not 1 <= self.board[y][x] <= 3 and \
+                    any((y - dy, x - dx) in counts for dy, dx in (COORDINATES[direction] for direction in directions)):
+                snake_weights = self.get_snake_weights()
+        foods = None
+        if not exact:
+            head_y, head_x = self.me["head"]['y'], self.me["head"]['x']
+            foods = [food for food in self.food
+                     if abs(food['y'] - head_y) + abs(food['x'] - head_x) <= horizon + FOOD_REACH]
+        self.lazy = (get_corner_weights(self.width, self.height, self.coefficients.corners), counts, heads,
+                     snake_weights, self.get_food_weights(self.food_coefficient(), foods), self.get_hazard_weights())
+
+    def lazy_snake_weight(self, y, x):
+        """
+        Weight of the grid in get_snake_weights(): 2 for every body grid one move away towards the spreading
+        directions, 1 for every body grid two moves away through a free grid
+        """
+        _, counts, heads, _, _, _ = self.lazy
+        weight = heads.get((y, x), 0)
+        for directions in (('up', 'left'), ('down', 'right')):
+            for direction in directions:
+                dy, dx = COORDINATES[direction]
+                sy, sx = y - dy, x - dx
+                if not (0 <= sy < self.height and 0 <= sx < self.width):
+                    continue
+                weight += 2 * counts.get((sy, sx), 0)
+                if not 1 <= self.board[sy][sx] <= 3:
+                    weight += sum(counts.get((sy - ty, sx - tx), 0)
+                                  for ty, tx in (COORDINATES[other] for other in directions))
+        return weight
+
+    def spread_window(self, radius):
+        """
+        Lazy mode: the snake layer of the grids within radius moves of my head, spread as spread_from_bodies() from
+        the body grids at most radius + 2 moves away, the others do not reach the window
+        """
+        _, counts, heads, _, _, _ = self.lazy
+        head_y, head_x = self.me["head"]['y'], self.me["head"]['x']
+        height, width, board = self.height, self.width, self.board
+        window = [[0] * width for _ in range(height)]
+        for (y, x), weight in heads.items():
+            window[y][x] = weight
+        for (y, x), count in counts.items():
+            if abs(y - head_y) + abs(x - head_x) > radius + 2:
+                continue
+            for directions in (('up', 'left'), ('down', 'right')):
+                for direction in directions:
+                    dy, dx = COORDINATES[direction]
+                    ny, nx = y + dy, x + dx
+                    if not (0 <= ny < height and 0 <= nx < width):
+                        continue
+                    window[ny][nx] += 2 * count
+                    if 1 <= board[ny][nx] <= 3:
+                        continue
+                    for other in directions:
+                        ty, tx = COORDINATES[other]
+                        if 0 <= ny + ty < height and 0 <= nx + tx < width:
+                            window[ny + ty][nx + tx] += count
+        self.window = (radius, window)
+
+    def weigh(self, y, x):
+        """
+        Lazy mode: the weight of the grid (x, y), computed on the first call and kept in self.weights
+        """
+        weight = self.weights[y][x]
+        if weight is None:
+            corner_weights, _, _, snake_weights, food_weights, hazard_weights = self.lazy
+            occupied = 1 <= self.board[y][x] <= 3
+            if occupied:
+                snake_weight = 0  # not added to a blocked grid
+            elif snake_weights is not None:
+                snake_weight = snake_weights[y][x]
+            elif self.window is not None and \
+                    abs(y - self.me["head"]['y']) + abs(x - self.me["head"]['x']) <= self.window[0]:
+                snake_weight = self.window[1][y][x]
+            else:
+                snake_weight = self.lazy_snake_weight(y, x)
+            weight = self.weights[y][x] = combine_weights(occupied, corner_weights[y][x], snake_weight,
+                                                          food_weights[y][x],
+                                                          hazard_weights[y][x] if hazard_weights is not None else 0)
+        return weight
+
+    def weigh_window(self, horizon):
+        # Lazy mode: weigh every grid within horizon moves of my head
+        if horizon <= self.horizon:
+            return
+        corner_weights, _, _, snake_weights, food_weights, hazard_weights = self.lazy
+        if snake_weights is None:
+            self.spread_window(horizon)
+            snake_weights = self.window[1]
+        head_y, head_x = self.me["head"]['y'], self.me["head"]['x']
+        for y in range(max(0, head_y - horizon), min(self.height, head_y + horizon + 1)):
+            reach = horizon - abs(y - head_y)
+            weights, board = self.weights[y], self.board[y]
+            for x in range(max(0, head_x - reach), min(self.width, head_x + reach + 1)):
+                if weights[x] is None:  # weigh(y, x)
+                    occupied = 1 <= board[x] <= 3
+                    weights[x] = combine_weights(occupied, corner_weights[y][x], 0 if occupied else snake_weights[y][x],
+                                                 food_weights[y][x],
+                                                 hazard_weights[y][x] if hazard_weights is not None else 0)
+        self.horizon = horizon
+
+    def previous_weights(self):
+        """
+        :return: the previous turn if its weights can be patched, else None. The reference is dropped, so the turns
+            of a game are not chained in memory
+        """
+        previous, self.previous = self.previous, None
+        if previous is None or previous.food_weights is None or previous.coefficients is not self.coefficients:
+            return None
+        if (previous.width, previous.height) != (self.width, self.height) or previous.me["id"] != self.me["id"]:
+            return None
+        return previous
+
+    def update_weights(self, previous):
+        """
+        get_weights() from the weights of the previous turn. The snake and food layers are spread again, which only
+        visits the grids around the bodies and the food, then the layers are combined again on the grids where the
+        board or one of the layers changed
+        """
+        corner_weights = get_corner_weights(self.width, self.height, self.coefficients.corners)
+        self.snake_weights = self.get_snake_weights()
+        self.food_weights = self.get_food_weights(self.food_coefficient())
+        self.hazard_weights = self.get_hazard_weights()
+        no_hazards = [0] * self.width
+        self.weights = [row[:] for row in previous.weights]
+        for i in range(self.height):
+            board, snake_weights, food_weights = self.board[i], self.snake_weights[i], self.food_weights[i]
+            former_board, former_snake_weights, former_food_weights = \
+                previous.board[i], previous.snake_weights[i], previous.food_weights[i]
+            hazard_weights = self.hazard_weights[i] if self.hazard_weights is not None else no_hazards
+            former_hazard_weights = previous.hazard_weights[i] if previous.hazard_weights is not None else no_hazards
+            if board == former_board and snake_weights == former_snake_weights and \
+                    food_weights == former_food_weights and hazard_weights == former_hazard_weights:
+                continue
+            for j in range(self.width):
+                if board[j] != former_board[j] or snake_weights[j] != former_snake_weights[j] or \
+                        food_weights[j] != former_food_weights[j] or hazard_weights[j] != former_hazard_weights[j]:
+                    self.weights[i][j] = combine_weights(1 <= board[j] <= 3, corner_weights[i][j], snake_weights[j],
+                                                         food_weights[j], hazard_weights[j])
 
-        health = [12, 36, 100]
-        coefficients = [1.6, 1.2, 1]
+    def food_coefficient(self):
         food_coef = 1
-        for i in range(8):
-            if self.me["health"] <= health[i]:
-                food_coef = coefficients[i]
+        for health, coefficient in zip(self.coefficients.health, self.coefficients.food):
+            if self.me["health"] <= health:
+                food_coef = coefficient
                 break
         for snake in self.snakes:
             if snake["id"] != self.me["id"] and snake["health"] >= self.me["health"]:
-                food_coef = 1.6
+                food_coef = self.coefficients.rival_food
                 break
-        self.detect_food(food_coef)
-
-        # self.attack_rivals()
+        return food_coef
 
-    def get_shortest_path(self, level=5):
+    def get_shortest_path(self, level=5, beam_width=None):
         """
         Can only be called after self.get_weights() is called
-        Modify self.distance -> shortest weight in the path from head to (x, y)
+        Among the paths of at most level grids from my head, pick the longest one, then the one with the smallest
+        total weight, then the one whose next grid is lighter (same choice as the former recursive DFS)
+        Modify self.distance -> shortest weight in the path from head to (x, y), for the grids around my head
         :param level:
-        :return:
+        :param beam_width: None for the exact search, otherwise only the beam_width lightest paths are kept per step
+        :return: (best_direction, shortest_weight, path)
         """
+        if beam_width is not None:
+            return self.beam_search(level, beam_width)
         y, x = self.me["head"]['y'], self.me["head"]['x']
-        path = []
-        shortest_weight, best_direction, weight = INT_MAX, None, INT_MAX
-        for direction, ny, nx in self.get_neighbors(y, x):
-            if self.weights[ny][nx] < INT_MAX:
-                shortest_path_weight, tmp_visited = self.DFS(ny, nx, level - 1, [(self.weights[y][x], y, x),
-                                                                                 (self.weights[ny][nx], ny, nx)])
-                if len(tmp_visited) >= len(path) and \
-                        (shortest_path_weight + self.weights[ny][nx] < shortest_weight or
-                         (shortest_path_weight + self.weights[ny][nx] == shortest_weight and self.weights[ny][nx] < weight) or
-                         len(tmp_visited) > len(path)):
-                    best_direction = direction
-                    shortest_weight = shortest_path_weight + self.weights[ny][nx]
-                    weight = self.weights[ny][nx]
-                    path = tmp_visited
-                self.distance[ny][nx] = shortest_path_weight + self.weights[ny][nx]
-        path[0] = ('Start', y, x)
-        return best_direction, shortest_weight, path
-
-    def DFS(self, y, x, level, visited: list):
+        width = self.width
+        if self.horizon is not None:
+            self.weigh_window(level)  # a path of level grids does not leave the window
+        weights = [weight for row in self.weights for weight in row]
+        memo = {}
+        reach = get_reach_masks(self.width, self.height, level)
+        start = y * width + x
+        best, best_direction, best_cell = None, None, None
+        for direction, ny, nx in self.neighbors[start]:
+            cell = ny * width + nx
+            if weights[cell] < INT_MAX:
+                mask = 1 << start | 1 << cell
+                shortest_path_weight, length = self.path_search(cell, level - 1, mask, weights, reach, memo)
+                candidate = (length, -(shortest_path_weight + weights[cell]), -weights[cell])
+                if best is None or candidate > best:
+                    best, best_direction, best_cell = candidate, direction, (cell, mask)
+                self.distance[ny][nx] = shortest_path_weight + weights[cell]
+        if best is None:
+            return None, INT_MAX, []
+
+        path = [('Start', y, x)]
+        cell, mask = best_cell
+        for remaining in range(level - 1, -1, -1):
+            path.append((weights[cell], cell // width, cell % width))
+            key = (cell, remaining, mask & reach[remaining][cell])
+            if remaining == 0 or memo[key][2] is None:
+                break
+            cell = memo[key][2]
+            mask |= 1 << cell
+        return best_direction, -best[1], path
+
+    def path_search(self, cell, level, mask, weights, reach, memo):
+        """
+        Best continuation of at most level grids from cell, avoiding the grids in the bitmask.
+        Only the visited grids within level moves matter, so they are the key of the memo:
+        memo[(cell, level, visited grids within reach)] = (shortest_weight, length, next cell or None)
+        :return: (shortest_weight, length)
+        """
         if level == 0:
-            return 0, visited
-        shortest_weight, weight, path = INT_MAX, INT_MAX, []
-        for _, ny, nx in self.get_neighbors(y, x):
-            if (self.weights[ny][nx], ny, nx) not in visited and self.weights[ny][nx] < INT_MAX:
-                shortest_path_weight, tmp_visited = self.DFS(ny, nx, level - 1,
-                                                             visited + [(self.weights[ny][nx], ny, nx)])
-                if len(tmp_visited) >= len(path) and \
-                        (shortest_path_weight + self.weights[ny][nx] < shortest_weight or
-                         (shortest_path_weight + self.weights[ny][nx] == shortest_weight and self.weights[ny][nx] < weight) or
-                         len(tmp_visited) > len(path)):
-                    shortest_weight = shortest_path_weight + self.weights[ny][nx]
-                    weight = self.weights[ny][nx]
-                    path = tmp_visited
-                self.distance[ny][nx] = shortest_path_weight + self.weights[ny][nx]
-        if not path:
-            return 0, visited
-        return shortest_weight, path
+            return 0, 0
+        key = (cell, level, mask & reach[level][cell])
+        if key in memo:
+            return memo[key][:2]
+        best, best_cell = (0, 0, 0), None
+        for _, ny, nx in self.neighbors[cell]:
+            neighbor = ny * self.width + nx
+            if not mask >> neighbor & 1 and weights[neighbor] < INT_MAX:
+                shortest_path_weight, length = self.path_search(neighbor, level - 1, mask | 1 << neighbor, weights,
+                                                                reach, memo)
+                candidate = (length + 1, -(shortest_path_weight + weights[neighbor]), -weights[neighbor])
+                if best_cell is None or candidate > best:
+                    best, best_cell = candidate, neighbor
+        memo[key] = (-best[1], best[0], best_cell)
+        return -best[1], best[0]
+
+    def beam_search(self, level, beam_width):
+        """
+        Approximation of get_shortest_path() for large levels, the search keeps the beam_width lightest paths
+        of every length and picks with the same rules at the end
+        """
+        y, x = self.me["head"]['y'], self.me["head"]['x']
+        width = self.width
+        if self.horizon is not None:
+            self.weigh_window(level)  # a path of level grids does not leave the window
+        weights = [weight for row in self.weights for weight in row]
+        start = y * width + x
+        beam = [(0, start, 1 << start, None, ())]  # (total weight, last cell, visited mask, direction, path)
+        best, best_path = None, None
+        for step in range(level):
+            extended = []
+            for total, cell, mask, direction, path in beam:
+                grown = False
+                for neighbor_direction, ny, nx in self.neighbors[cell]:
+                    neighbor = ny * width + nx
+                    if not mask >> neighbor & 1 and weights[neighbor] < INT_MAX:
+                        grown = True
+                        extended.append((total + weights[neighbor], neighbor, mask | 1 << neighbor,
+                                         direction or neighbor_direction, path + (neighbor,)))
+                if not grown and path:
+                    candidate = (len(path), -total, -weights[path[-1]])
+                    if best is None or candidate > best:
+                        best, best_path = candidate, (direction, total, path)
+            if not extended:
+                break
+            extended.sort(key=lambda state: state[0])
+            beam = extended[:beam_width]
+            if step == level - 1 or not beam:
+                for total, cell, mask, direction, path in beam:
+                    candidate = (len(path), -total, -weights[path[-1]])
+                    if best is None or candidate > best:
+                        best, best_path = candidate, (direction, total, path)
+        if best is None:
+            return None, INT_MAX, []
+        direction, total, cells = best_path
+        for cell in cells[:1]:
+            self.distance[cell // width][cell % width] = total
+        return direction, total, [('Start', y, x)] + [(weights[cell], cell // width, cell % width) for cell in cells]
@@ -1,18 +1,180 @@
+import json
+import logging
+import logging.handlers
 import os
+import queue
 import random
+import sys
+import time
 import cherrypy
 
-from preprocessing import Preprocessing
+try:
+    import orjson
+except ImportError:  # the standard json module is used instead
+    orjson = None
+
+from metrics import Metrics
+from mcts import MCTS
+from minimax import Minimax, PARANOID, BEST_REPLY
+from parallel import ParallelSearch
+from ponder import Ponderer
+from positions import PositionCache
+from preprocessing import Coefficients
+from session import SessionStore
+
+try:
+    from vectorized import VectorizedPreprocessing as Preprocessing
+except ImportError:  # NumPy is not installed
+    from preprocessing import Preprocessing
 
 """
 This is a simple Battlesnake server written in Python.
 For instructions see https://github.com/BattlesnakeOfficial/starter-snake-python/README.md
 """
 
+# "weights" for the weighted shortest path, "minimax" for Minimax, "mcts" for Monte Carlo Tree Search, "auto" to choose
+# Minimax or MCTS per game
+ENGINE = os.environ.get("ENGINE", "weights")
+MCTS_SNAKES = int(os.environ.get("MCTS_SNAKES", "4"))  # "auto" uses MCTS for games with more snakes than this
+SAFETY_MARGIN = int(os.environ.get("SAFETY_MARGIN", "100"))  # ms kept back from the game's timeout
+MAX_DEPTH = int(os.environ.get("MAX_DEPTH", "32"))  # upper bound for iterative deepening
+PATH_LEVEL = int(os.environ.get("PATH_LEVEL", "8"))  # length of the paths searched by get_shortest_path()
+PATH_BEAM = int(os.environ["PATH_BEAM"]) if os.environ.get("PATH_BEAM") else None  # beam width, unset for exact
+# patch the weights of the previous turn of the game, on the boards of at most vectorized.PATCH_GRIDS grids with NumPy
+INCREMENTAL = os.environ.get("INCREMENTAL", "1") == "1"
+# "1" weighs only the grids within PATH_LEVEL moves, "approximate" also spreads only the food near them, "0" every grid
+LAZY_WEIGHTS = os.environ.get("LAZY_WEIGHTS", "0")
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", "0"))  # worker processes of the parallel Minimax, 0 to disable
+PONDER = os.environ.get("PONDER", "0") == "1"  # search the next turn of Minimax games between their moves
+PONDER_CPU = float(os.environ.get("PONDER_CPU", "0.5"))  # share of one core used by pondering
+PONDER_POSITIONS = int(os.environ.get("PONDER_POSITIONS", "8"))  # rivals' replies pondered after a move
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "auto")  # "best-reply", "paranoid" or "auto" to choose it per game
+PARANOID_SNAKES = int(os.environ.get("PARANOID_SNAKES", "4"))  # "auto" is paranoid up to this many snakes
+SERVER_MODE = os.environ.get("SERVER_MODE", "development")  # "production" turns off autoreload and the access log
+THREAD_POOL = int(os.environ.get("THREAD_POOL", "0")) or os.cpu_count() or 1  # request threads, one per core
+SOCKET_QUEUE = int(os.environ.get("SOCKET_QUEUE", "64"))  # connections the OS keeps before refusing new ones
+MIN_BUDGET = int(os.environ.get("MIN_BUDGET", "10"))  # ms, /move falls back when its share of the budget is shorter
+# queued connections beyond which /move falls back whatever its budget, unset for no cap
+MAX_QUEUE = int(os.environ["MAX_QUEUE"]) if os.environ.get("MAX_QUEUE") else None
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+METRICS = os.environ.get("METRICS", "1") == "1"  # phase timing and search counters served by /metrics
+# JSON file of the get_weights() coefficients, e.g. written by tuning.py, unset for the defaults
+COEFFICIENTS = Coefficients.load(os.environ["COEFFICIENTS"]) if os.environ.get("COEFFICIENTS") else None
+# File written by positions.py, the positions it holds are answered by Minimax without searching
+POSITION_CACHE = os.environ.get("POSITION_CACHE")
+
+sessions = SessionStore(
+    ttl=int(os.environ.get("SESSION_TTL", "300")),  # s, idle sessions are evicted after that
+    max_sessions=int(os.environ.get("MAX_SESSIONS", "64")),
+    table_megabytes=float(os.environ.get("TABLE_MEGABYTES", "8")),  # transposition table size of every game
+)
+parallel = None  # ParallelSearch, forked in __main__ before the server starts its threads
+ponderer = None  # Ponderer, started in __main__
+positions = PositionCache(POSITION_CACHE) if POSITION_CACHE else None
+logger = logging.getLogger("nidhogg")
+metrics = Metrics(METRICS)
+
+
+def start_logging():
+    """
+    Request threads only put the records into a queue, a background thread writes them to stdout
+    :return: the QueueListener, stop() it to flush the remaining records
+    """
+    records = queue.Queue()
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    listener = logging.handlers.QueueListener(records, logging.StreamHandler(sys.stdout))
+    listener.start()
+    return listener
+
+
+def json_processor(entity):
+    """
+    Replaces the processor of cherrypy.tools.json_in(), decodes with orjson when it is installed
+    """
+    if not entity.headers.get("Content-Length", ""):
+        raise cherrypy.HTTPError(411)
+    start = time.perf_counter()
+    body = entity.fp.read()
+    with cherrypy.HTTPError.handle(ValueError, 400, "Invalid JSON document"):
+        cherrypy.serving.request.json = orjson.loads(body) if orjson else json.loads(body)
+    metrics.phase("decode", start)
+
+
+def json_handler(*args, **kwargs):
+    """
+    Replaces the handler of cherrypy.tools.json_out(), encodes with orjson when it is installed
+    """
+    value = cherrypy.serving.request._json_inner_handler(*args, **kwargs)
+    start = time.perf_counter()
+    body = orjson.dumps(value) if orjson else json.dumps(value).encode("utf-8")
+    metrics.phase("encode", start)
+    return body
+
+
+def queue_depth():
+    """
+    :return: number of accepted connections waiting for a free request thread, 0 if the server is not running
+    """
+    requests = getattr(getattr(cherrypy.server, "httpserver", None), "requests", None)
+    return getattr(requests, "qsize", 0)
+
+
+def share_budget(deadline, start, waiting):
+    """
+    Admission control: the games move at about the same pace, so the /move requests of the games that moved in the
+    last second, or at least of the requests waiting for a thread, share the threads and this /move keeps only its
+    share of the budget. The time a /move waited itself is in the latency the engine reports, see get_deadline()
+    :return: the deadline of this /move
+    """
+    games = max(sessions.active(1.0), waiting + 1)
+    return start + (deadline - start) / -(-games // THREAD_POOL)
+
+
+def cached_move(data, session):
+    """
+    :return: the move stored for this position in the position cache, None if it is not there
+    """
+    entry = positions.probe(Minimax(data["board"], data["you"], session, table=False).zobristHash())
+    return entry[2] if entry is not None else None
+
+
+def search_mode(data):
+    """
+    Paranoid search moves every rival in every round, its cost grows with the product of their moves, so "auto" keeps
+    it for boards with few snakes and uses best-reply search on crowded boards
+    """
+    if SEARCH_MODE != "auto":
+        return SEARCH_MODE
+    return PARANOID if len(data["board"]["snakes"]) <= PARANOID_SNAKES else BEST_REPLY
+
+
+def game_engine(data):
+    """
+    Alpha-beta over simultaneous moves grows with the number of snakes, so "auto" keeps Minimax for the games with few
+    snakes and uses MCTS, which is anytime, on crowded boards
+    """
+    if ENGINE != "auto":
+        return ENGINE
+    return "mcts" if len(data["board"]["snakes"]) > MCTS_SNAKES else "minimax"
+
+
+def get_deadline(data, start, session):
+    """
+    The engine reports the latency of our last move, which is the network round trip plus the time we spent on it.
+    :return: time.perf_counter() value at which the search must stop
+    """
+    network = 0
+    if session.compute_time is not None and str(data["you"].get("latency", "")).isdigit():
+        network = max(0, int(data["you"]["latency"]) - session.compute_time)
+    budget = max(data["game"]["timeout"] - SAFETY_MARGIN - network, 0)
+    return start + budget / 1000
+
 
 class Battlesnake(object):
     @cherrypy.expose
-    @cherrypy.tools.json_out()
+    @cherrypy.tools.json_out(handler=json_handler)
     def index(self):
         # This function is called when you register your Battlesnake on play.battlesnake.com
         # It controls your Battlesnake appearance and author permissions.
@@ -26,51 +188,133 @@ class Battlesnake(object):
         }
 
     @cherrypy.expose
-    @cherrypy.tools.json_in()
+    @cherrypy.tools.json_in(processor=json_processor)
     def start(self):
         # This function is called everytime your snake is entered into a game.
         # cherrypy.request.json contains information about the game that's about to be played.
         data = cherrypy.request.json
+        sessions.start(data)
 
-        print("START")
+        logger.info("START %s", data["game"]["id"])
         return "ok"
 
     @cherrypy.expose
-    @cherrypy.tools.json_in()
-    @cherrypy.tools.json_out()
+    @cherrypy.tools.json_in(processor=json_processor)
+    @cherrypy.tools.json_out(handler=json_handler)
     def move(self):
         # This function is called on every turn of a game. It's how your snake decides where to move.
         # Valid moves are "up", "down", "left", or "right".
         # TODO: Use the information in cherrypy.request.json to decide your next move.
+        start = time.perf_counter()
         data = cherrypy.request.json
-        info = Preprocessing(data["board"], data["you"])
+        session = sessions.get(data)
+        if ponderer is None:
+            return self.choose_move(data, session, start)
+        ponderer.enter(session)
+        try:
+            return self.choose_move(data, session, start)
+        finally:
+            ponderer.leave()
 
-        # Choose a random direction to move in
-        possible_moves = ["up", "down", "left", "right"]
-        info.get_weights()
-        move, shortest_weight, path = info.get_shortest_path(8)
-        print("move:", move)
-        print("smallest weight:", shortest_weight)
-        print("path:", path)
+    def choose_move(self, data, session, start):
+        deadline = get_deadline(data, start, session)
 
+        if session.engine is None:
+            session.engine = game_engine(data)
+        move, engine = None, session.engine
+        previous = session.preprocessing if INCREMENTAL and session.previous is not None and \
+            session.previous["turn"] == data["turn"] - 1 else None
+        session.preprocessing = None
+        if session.search_mode is None:
+            session.search_mode = search_mode(data)
+        waiting = queue_depth()
+        deadline = share_budget(deadline, start, waiting)
+        phase = time.perf_counter()
+        cached = cached_move(data, session) if engine == "minimax" and positions is not None else None
+        if cached is not None:
+            move, engine = cached, "cache"
+            phase = metrics.phase("cache", phase)
+        elif (MAX_QUEUE is not None and waiting > MAX_QUEUE) or deadline - time.perf_counter() < MIN_BUDGET / 1000:
+            # Too many games are waiting for a thread, answer quickly so that their budget is not spent in the queue
+            move, engine = Preprocessing(data["board"], data["you"]).safest_move(), "fallback"
+            logger.warning("%d requests waiting, fallback move", waiting)
+        elif engine == "minimax" and parallel is not None:
+            # the workers' counters are not collected
+            move = parallel.best_move(data, deadline, MAX_DEPTH, mode=session.search_mode)
+            phase = metrics.phase("search", phase)
+        elif engine == "minimax":
+            search = Minimax(data["board"], data["you"], session)
+            phase = metrics.phase("preprocessing", phase)
+            probes, hits = search.table.probes, search.table.hits
+            move = search.best_move(deadline, MAX_DEPTH)
+            phase = metrics.phase("search", phase)
+            metrics.search(search, probes, hits)
+            logger.debug("depth reached: %d, first move cutoff rate: %.2f", search.depth_reached,
+                         search.first_cutoff_rate())
+            if ponderer is not None and move is not None:
+                ponderer.submit(data, move, session)
+        elif engine == "mcts":
+            search = MCTS(data["board"], data["you"], session)
+            phase = metrics.phase("preprocessing", phase)
+            move = search.best_move(deadline)
+            phase = metrics.phase("search", phase)
+            logger.debug("iterations: %d, nodes: %d", search.iterations, search.nodes)
+        if move is None:
+            engine = "weights"
+            info = Preprocessing(data["board"], data["you"], COEFFICIENTS, previous, session.hazards)
+            phase = metrics.phase("preprocessing", phase)
+            info.get_weights(PATH_LEVEL if LAZY_WEIGHTS != "0" else None, LAZY_WEIGHTS != "approximate")
+            if info.food_weights is not None:  # the layers are kept on the boards where patching is cheaper
+                session.preprocessing = info
+            phase = metrics.phase("weights", phase)
+            move, shortest_weight, path = info.get_shortest_path(PATH_LEVEL, PATH_BEAM)
+            metrics.phase("path", phase)
+            logger.debug("smallest weight: %s, path: %s", shortest_weight, path)
+        logger.info("move: %s", move)
+        metrics.move(engine, start)
+
+        session.previous = data
+        session.compute_time = int((time.perf_counter() - start) * 1000)
         return {"move": move}
 
     @cherrypy.expose
-    @cherrypy.tools.json_in()
+    @cherrypy.tools.json_in(processor=json_processor)
     def end(self):
         # This function is called when a game your snake was in ends.
         # It's purely for informational purposes, you don't have to make any decisions here.
         data = cherrypy.request.json
+        session = sessions.end(data)
+        if ponderer is not None and session is not None:
+            with ponderer.condition:
+                ponderer.cancel(session)
 
-        print("END")
+        logger.info("END %s", data["game"]["id"])
         return "ok"
 
+    @cherrypy.expose
+    def metrics(self):
+        # Scraped by Prometheus: latency histogram of every phase, nodes searched, transposition table hits and depth
+        if not METRICS:
+            raise cherrypy.NotFound()
+        cherrypy.response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+        return metrics.render()
+
 
 if __name__ == "__main__":
+    if ENGINE in ("minimax", "auto") and SEARCH_WORKERS:
+        parallel = ParallelSearch(SEARCH_WORKERS, sessions.ttl, sessions.max_sessions, sessions.table_megabytes)
+    elif ENGINE in ("minimax", "auto") and PONDER:
+        # the transposition tables of the parallel search live in the workers, pondering could not warm them
+        ponderer = Ponderer(PONDER_CPU, PONDER_POSITIONS, MAX_DEPTH)
+    log_listener = start_logging()
     server = Battlesnake()
     cherrypy.config.update({"server.socket_host": "0.0.0.0"})
     cherrypy.config.update(
         {"server.socket_port": int(os.environ.get("PORT", "8080")), }
     )
-    print("Starting Battlesnake Server...")
+    cherrypy.config.update({"server.thread_pool": THREAD_POOL, "server.socket_queue_size": SOCKET_QUEUE})
+    if SERVER_MODE == "production":
+        cherrypy.config.update({"environment": "production", "log.screen": False})
+    logger.info("Starting Battlesnake Server...")
     cherrypy.quickstart(server)
+    log_listener.stop()
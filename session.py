@@ -0,0 +1,108 @@
+"""
+Per-game sessions
+    - created on /start, reused on every /move and evicted on /end or after being idle for ttl seconds
+    - keeps the tables that are expensive to build, so they are built once per game instead of once per move
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from hazards import Hazards, hazard_damage
+from minimax import get_zobrist_table
+from preprocessing import get_neighbors_table
+from transposition import TranspositionTable
+
+
+class Session:
+    def __init__(self, game, width, height, table_megabytes=8):
+        self.game_id = game["id"]
+        self.timeout = game["timeout"]
+        self.width = width
+        self.height = height
+        self.zobrist_lookup = get_zobrist_table(width, height)
+        self.neighbors = get_neighbors_table(width, height)
+        self.snake_ids = {}  # snake id -> integer id of the Snake of Minimax, the same for the whole game
+        self.player_keys = []  # integer id -> Zobrist key of the player to move, filled by Minimax
+        self.history = {}  # history heuristic of Minimax, kept across the turns of the game
+        self.engine = None  # engine of the server in this game, chosen on the first move
+        self.search_mode = None  # search mode of Minimax in this game, see minimax.py, chosen on the first move
+        self.table_megabytes = table_megabytes
+        self.table = None  # transposition table of Minimax, built by get_table(), the other engines never use it
+        self.hazards = Hazards(width, height, hazard_damage(game))  # grows with the royale hazards of the game
+
+        self.previous = None  # data of the previous /move
+        self.preprocessing = None  # Preprocessing of the previous /move if it used the weights, patched by the next one
+        self.compute_time = None  # ms spent in the previous /move, used to estimate the network latency
+        self.last_seen = time.monotonic()
+
+    def get_table(self):
+        """
+        :return: the transposition table of the game, built on the first Minimax search of the game
+        """
+        if self.table is None:
+            self.table = TranspositionTable.from_memory(self.table_megabytes)
+        return self.table
+
+
+class SessionStore:
+    def __init__(self, ttl=300, max_sessions=64, table_megabytes=8):
+        """
+        :param ttl: seconds a session is kept without any request
+        :param max_sessions: the least recently used session is evicted beyond this number
+        :param table_megabytes: size of the transposition table of every session
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.table_megabytes = table_megabytes
+        self.sessions = OrderedDict()  # (game id, snake id) -> Session, least recently used first
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(data):
+        return data["game"]["id"], data["you"]["id"]
+
+    def start(self, data):
+        session = Session(data["game"], data["board"]["width"], data["board"]["height"], self.table_megabytes)
+        with self.lock:
+            self.sessions[self.key(data)] = session
+            self.evict()
+        return session
+
+    def get(self, data):
+        """
+        :return: the session of the game, a new one if /start was missed (e.g. the server restarted mid-game)
+        """
+        key = self.key(data)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is not None:
+                self.sessions.move_to_end(key)
+                session.last_seen = time.monotonic()
+                self.evict()
+                return session
+        return self.start(data)
+
+    def end(self, data):
+        with self.lock:
+            return self.sessions.pop(self.key(data), None)
+
+    def active(self, seconds):
+        """
+        :return: number of sessions that had a request in the last seconds
+        """
+        now = time.monotonic()
+        with self.lock:
+            return sum(now - session.last_seen <= seconds for session in self.sessions.values())
+
+    def evict(self):
+        # Must be called with self.lock held
+        now = time.monotonic()
+        while self.sessions:
+            key, session = next(iter(self.sessions.items()))
+            if len(self.sessions) <= self.max_sessions and now - session.last_seen <= self.ttl:
+                break
+            del self.sessions[key]
+
+    def __len__(self):
+        return len(self.sessions)
@@ -0,0 +1,325 @@
+"""
+Offline self-play with the standard Battlesnake rules
+    - a game is stepped in process, the players get the same data as /move, without HTTP
+    - the state of a game is a few flat arrays indexed by y * width + x, the JSON of /move is only built for the players
+    - play_batch() steps many games in lockstep, a player with a batch() method answers all of its boards at once
+
+Rules, in the order of the standard ruleset: move, reduce health, hazard damage, feed, spawn food, eliminate
+(out of health, out of bounds, then self, body and head-to-head collisions, all checked on the same board).
+"""
+
+import random
+import time
+from array import array
+from collections import deque
+
+from preprocessing import Preprocessing
+from mcts import MCTS
+from minimax import Minimax
+
+MAX_HEALTH = 100
+START_LENGTH = 3
+
+
+class Game:
+    def __init__(self, width=11, height=11, snakes=4, seed=None, hazards=(), hazard_damage=14,
+                 minimum_food=1, food_spawn_chance=15, timeout=500, shrink_every=0):
+        """
+        :param hazards: (y, x) of the hazard grids, they stay for the whole game
+        :param shrink_every: royale, every shrink_every turns the hazards cover one more row or column of a random
+            side, 0 to never shrink
+        :param food_spawn_chance: percent chance to spawn one food per turn when there is at least minimum_food
+        """
+        self.width = width
+        self.height = height
+        self.rng = random.Random(seed)
+        self.game_id = "sim-%s" % seed
+        self.timeout = timeout
+        self.hazard_damage = hazard_damage
+        self.minimum_food = minimum_food
+        self.food_spawn_chance = food_spawn_chance
+        self.turn = 0
+
+        self.food = bytearray(width * height)  # 1 for food
+        self.hazards = bytearray(width * height)  # 1 for hazard
+        for y, x in hazards:
+            self.hazards[y * width + x] = 1
+        self.shrink_every = shrink_every
+        self.safe = [0, height - 1, 0, width - 1]  # bottom, top, left and right bounds of the area without hazards
+        self.bodies = []  # deque of flat grids of every snake, head first
+        self.health = array('h', [MAX_HEALTH]) * snakes
+        self.alive = bytearray([1]) * snakes
+        self.eliminated = [None] * snakes  # (turn, cause) of every eliminated snake
+        self.place_snakes(snakes)
+        self.place_food()
+
+    def place_snakes(self, snakes):
+        """
+        Fixed starting points of the standard ruleset, corners first, then the middle of the edges, random beyond 8
+        """
+        w, h = self.width, self.height
+        low_x, mid_x, high_x = 1, (w - 1) // 2, w - 2
+        low_y, mid_y, high_y = 1, (h - 1) // 2, h - 2
+        corners = [(low_y, low_x), (high_y, low_x), (low_y, high_x), (high_y, high_x)]
+        edges = [(mid_y, low_x), (low_y, mid_x), (high_y, mid_x), (mid_y, high_x)]
+        self.rng.shuffle(corners)
+        self.rng.shuffle(edges)
+        starts = [y * w + x for y, x in corners + edges]
+        free = [cell for cell in range(w * h) if cell not in starts]
+        self.rng.shuffle(free)
+        starts += free
+        for i in range(snakes):
+            self.bodies.append(deque([starts[i]] * START_LENGTH))
+
+    def place_food(self):
+        """
+        One food diagonal to every head, towards the center of the board, and one food at the center
+        """
+        w, h = self.width, self.height
+        center_y, center_x = (h - 1) // 2, (w - 1) // 2
+        occupied = {body[0] for body in self.bodies}
+        for body in self.bodies:
+            y, x = divmod(body[0], w)
+            candidates = []
+            for fy, fx in ((y - 1, x - 1), (y - 1, x + 1), (y + 1, x - 1), (y + 1, x + 1)):
+                if 0 <= fy < h and 0 <= fx < w and (fy, fx) != (center_y, center_x) and \
+                        fy * w + fx not in occupied and \
+                        (abs(fy - center_y) < abs(y - center_y) or abs(fx - center_x) < abs(x - center_x)):
+                    candidates.append(fy * w + fx)
+            if candidates:
+                cell = self.rng.choice(candidates)
+                self.food[cell] = 1
+                occupied.add(cell)
+        if center_y * w + center_x not in occupied:
+            self.food[center_y * w + center_x] = 1
+
+    def spawn_food(self):
+        count = sum(self.food)
+        spawn = 0
+        if count < self.minimum_food:
+            spawn = self.minimum_food - count
+        elif self.food_spawn_chance and self.rng.randrange(100) < self.food_spawn_chance:
+            spawn = 1
+        if not spawn:
+            return
+        occupied = bytearray(self.food)
+        for i, body in enumerate(self.bodies):
+            if self.alive[i]:
+                for cell in body:
+                    if cell >= 0:
+                        occupied[cell] = 1
+        free = [cell for cell in range(len(occupied)) if not occupied[cell]]
+        for cell in self.rng.sample(free, min(spawn, len(free))):
+            self.food[cell] = 1
+
+    def is_over(self):
+        alive = sum(self.alive)
+        return alive == 0 or (alive == 1 and len(self.bodies) > 1)
+
+    def winner(self):
+        """
+        :return: index of the last snake alive, None for a draw or a game still running
+        """
+        if sum(self.alive) == 1 and len(self.bodies) > 1:
+            return self.alive.index(1)
+        return None
+
+    def step(self, moves):
+        """
+        Applies one turn
+        :param moves: direction of every snake, indexed like the snakes, None or an invalid direction counts as "up"
+        """
+        w, h = self.width, self.height
+        alive = [i for i in range(len(self.bodies)) if self.alive[i]]
+        for i in alive:
+            body = self.bodies[i]
+            y, x = divmod(body[0], w)
+            move = moves[i]
+            if move == 'down':
+                y -= 1
+            elif move == 'left':
+                x -= 1
+            elif move == 'right':
+                x += 1
+            else:
+                y += 1
+            body.pop()
+            body.appendleft(y * w + x if 0 <= y < h and 0 <= x < w else -1)  # -1 for out of bounds
+            self.health[i] -= 1
+
+        for i in alive:
+            head = self.bodies[i][0]
+            if head >= 0 and self.hazards[head] and not self.food[head]:
+                self.health[i] = max(self.health[i] - self.hazard_damage, 0)
+        eaten = set()
+        for i in alive:
+            head = self.bodies[i][0]
+            if head >= 0 and self.food[head]:
+                eaten.add(head)
+                self.health[i] = MAX_HEALTH
+                self.bodies[i].append(self.bodies[i][-1])
+        for cell in eaten:
+            self.food[cell] = 0
+        self.spawn_food()
+        self.turn += 1
+        self.eliminate(alive)
+        if self.shrink_every and self.turn % self.shrink_every == 0:
+            self.shrink()
+
+    def shrink(self):
+        # Royale: the hazards take the outer row or column of the safe area on a random side
+        bottom, top, left, right = self.safe
+        if bottom > top or left > right:
+            return
+        side = self.rng.randrange(4)
+        if side < 2:
+            y = (bottom, top)[side]
+            cells = [y * self.width + x for x in range(left, right + 1)]
+        else:
+            x = (left, right)[side - 2]
+            cells = [y * self.width + x for y in range(bottom, top + 1)]
+        for cell in cells:
+            self.hazards[cell] = 1
+        self.safe[side] += 1 if side % 2 == 0 else -1
+
+    def eliminate(self, alive):
+        remaining = []
+        for i in alive:
+            if self.health[i] <= 0:
+                self.eliminated[i] = (self.turn, "out-of-health")
+            elif self.bodies[i][0] < 0:
+                self.eliminated[i] = (self.turn, "wall-collision")
+            else:
+                remaining.append(i)
+
+        segments = bytearray(self.width * self.height)  # number of body grids, heads excluded
+        heads = {}  # head grid -> snakes
+        for i in remaining:
+            body = self.bodies[i]
+            for cell in body:
+                segments[cell] += 1
+            segments[body[0]] -= 1
+            heads.setdefault(body[0], []).append(i)
+        collisions = []
+        for i in remaining:
+            head = self.bodies[i][0]
+            if segments[head]:
+                collisions.append((i, "body-collision"))
+                continue
+            length = len(self.bodies[i])
+            if any(j != i and len(self.bodies[j]) >= length for j in heads[head]):
+                collisions.append((i, "head-collision"))
+        for i, cause in collisions:
+            self.eliminated[i] = (self.turn, cause)
+
+        for i in alive:
+            if self.eliminated[i] is not None:
+                self.alive[i] = 0
+
+    def snake_json(self, i):
+        w = self.width
+        body = [{"x": cell % w, "y": cell // w} for cell in self.bodies[i]]
+        return {"id": "snake-%d" % i, "name": "snake-%d" % i, "health": self.health[i], "body": body,
+                "head": body[0], "length": len(body), "latency": "0", "shout": ""}
+
+    def requests(self):
+        """
+        :return: {snake index: /move request body} for every snake alive, the board is shared and must not be changed
+        """
+        w = self.width
+        snakes = {i: self.snake_json(i) for i in range(len(self.bodies)) if self.alive[i]}
+        board = {
+            "height": self.height, "width": w,
+            "food": [{"x": cell % w, "y": cell // w} for cell in range(len(self.food)) if self.food[cell]],
+            "hazards": [{"x": cell % w, "y": cell // w} for cell in range(len(self.hazards)) if self.hazards[cell]],
+            "snakes": list(snakes.values()),
+        }
+        game = {"id": self.game_id, "timeout": self.timeout, "ruleset": {"name": "standard"}}
+        return {i: {"game": game, "turn": self.turn, "board": board, "you": snake} for i, snake in snakes.items()}
+
+    def result(self):
+        return {
+            "winner": self.winner(),
+            "turns": self.turn,
+            "lengths": [len(body) for body in self.bodies],
+            "eliminated": list(self.eliminated),
+        }
+
+
+def play(game, players, max_turns=1000):
+    """
+    :param players: players[i] is called with the /move data of snake i and returns its direction
+    :return: game.result()
+    """
+    while not game.is_over() and game.turn < max_turns:
+        moves = [None] * len(players)
+        for i, data in game.requests().items():
+            moves[i] = players[i](data)
+        game.step(moves)
+    return game.result()
+
+
+def play_batch(games, players, max_turns=1000):
+    """
+    Steps every game one turn at a time. A player with a batch() method gets the boards of all the games in one call
+    :return: game.result() of every game
+    """
+    running = list(games)
+    while running:
+        requests = [(game, i, data) for game in running for i, data in game.requests().items()]
+        moves = {id(game): [None] * len(players) for game in running}
+        for index, player in enumerate(players):
+            own = [(game, data) for game, i, data in requests if i == index]
+            if not own:
+                continue
+            if hasattr(player, "batch"):
+                answers = player.batch([data for _, data in own])
+            else:
+                answers = [player(data) for _, data in own]
+            for (game, _), move in zip(own, answers):
+                moves[id(game)][index] = move
+        for game in running:
+            game.step(moves[id(game)])
+        running = [game for game in running if not game.is_over() and game.turn < max_turns]
+    return [game.result() for game in games]
+
+
+def weights_player(level=5, beam_width=None, preprocessing=Preprocessing, coefficients=None):
+    """
+    :param coefficients: Coefficients of get_weights(), None for the defaults
+    :return: player of the weighted shortest path, the "weights" engine of the server
+    """
+    def player(data):
+        info = preprocessing(data["board"], data["you"], coefficients)
+        info.get_weights()
+        return info.get_shortest_path(level, beam_width)[0]
+    return player
+
+
+def minimax_player(depth=2, mode=None):
+    """
+    :param mode: search mode of Minimax, see minimax.py
+    :return: player searching Minimax at a fixed depth, the weighted shortest path if every move loses
+    """
+    fallback = weights_player()
+
+    def player(data):
+        return Minimax(data["board"], data["you"], mode=mode).best_move(None, depth) or fallback(data)
+    return player
+
+
+def mcts_player(iterations=500, budget=None):
+    """
+    :param budget: ms per move, None to run a fixed number of iterations
+    :return: player of the Monte Carlo Tree Search, the weighted shortest path if every move is a dead end
+    """
+    fallback = weights_player()
+
+    def player(data):
+        deadline = time.perf_counter() + budget / 1000 if budget is not None else None
+        return MCTS(data["board"], data["you"]).best_move(deadline, iterations) or fallback(data)
+    return player
+
+
+def safest_player(data):
+    return Preprocessing(data["board"], data["you"]).safest_move()
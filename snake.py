@@ -0,0 +1,39 @@
+"""
+Compact snake model of the search, built once per request from the JSON of /move
+    - the ids are small integers, the same for the whole game when the session keeps the id map
+    - a grid is a flat index y * width + x, the body is a deque of flat grids, head first
+"""
+
+from collections import deque
+
+
+class Snake:
+    __slots__ = ('id', 'name', 'body', 'health', 'length', 'alive')
+
+    def __init__(self, id, name, body, health, length):
+        self.id = id  # integer id, indexes the player keys, killers and history of Minimax
+        self.name = name  # id of the snake in the JSON
+        self.body = body
+        self.health = health
+        self.length = length
+        self.alive = True
+
+    def __repr__(self):
+        return "Snake(%d, %r, health=%d, length=%d%s)" % (self.id, self.name, self.health, self.length,
+                                                         "" if self.alive else ", dead")
+
+
+def build_snakes(snakes, width, ids):
+    """
+    :param snakes: board["snakes"] of /move
+    :param ids: JSON id -> integer id, the snakes seen for the first time are added to it
+    :return: [Snake] in the order of snakes
+    """
+    result = []
+    for snake in snakes:
+        number = ids.get(snake["id"])
+        if number is None:
+            number = ids[snake["id"]] = len(ids)
+        body = deque(body['y'] * width + body['x'] for body in snake["body"])
+        result.append(Snake(number, snake["id"], body, snake["health"], snake["length"]))
+    return result
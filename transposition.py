@@ -0,0 +1,101 @@
+"""
+Transposition Table for Minimax
+    - fixed capacity, stored as parallel arrays indexed by hash & mask
+    - two-tier buckets: slot 0 keeps the deepest search, slot 1 is always replaced
+"""
+
+from array import array
+
+EXACT, LOWER, UPPER = 0, 1, 2  # bound type of the stored score
+DIRECTIONS = ('up', 'down', 'left', 'right')
+MOVE_INDEX = {direction: i for i, direction in enumerate(DIRECTIONS)}
+ENTRY_SIZE = 8 + 8 + 1 + 1 + 1  # bytes per entry: key, score, depth, bound, move
+
+
+class TranspositionTable:
+    def __init__(self, buckets=2 ** 16):
+        """
+        :param buckets: rounded down to a power of two, the table holds 2 * buckets entries
+        """
+        buckets = 1 << max(buckets.bit_length() - 1, 0)
+        self.mask = buckets - 1
+        size = 2 * buckets
+        self.keys = array('Q', bytes(8 * size))
+        self.scores = array('d', bytes(8 * size))
+        self.depths = array('b', [-1]) * size  # -1 for empty slot
+        self.bounds = array('b', bytes(size))
+        self.moves = array('b', [-1]) * size  # index in DIRECTIONS, -1 for no move
+
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0  # a valid entry of another position is replaced
+
+    @classmethod
+    def from_memory(cls, megabytes):
+        return cls(int(megabytes * 2 ** 20 / (2 * ENTRY_SIZE)))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def probe(self, hash_value):
+        """
+        :return: (score, depth, bound, move) or None if the position is not stored
+        """
+        self.probes += 1
+        slot = (hash_value & self.mask) << 1
+        for i in (slot, slot + 1):
+            if self.keys[i] == hash_value and self.depths[i] >= 0:
+                self.hits += 1
+                move = self.moves[i]
+                return self.scores[i], self.depths[i], self.bounds[i], DIRECTIONS[move] if move >= 0 else None
+        return None
+
+    def store(self, hash_value, score, depth, bound, move=None):
+        self.stores += 1
+        keys, depths = self.keys, self.depths
+        slot = (hash_value & self.mask) << 1
+        if keys[slot] == hash_value and depths[slot] >= 0:
+            pass  # same position, refresh the depth-preferred slot
+        elif depth >= depths[slot]:
+            if keys[slot + 1] == hash_value and depths[slot + 1] >= 0:
+                depths[slot + 1] = -1  # promoted to the depth-preferred slot
+            if depths[slot] >= 0:
+                self.move_entry(slot, slot + 1)  # the shallower entry moves down to the always-replace slot
+        else:
+            slot += 1
+            if depths[slot] >= 0 and keys[slot] != hash_value:
+                self.overwrites += 1
+        keys[slot] = hash_value
+        self.scores[slot] = score
+        depths[slot] = min(depth, 127)
+        self.bounds[slot] = bound
+        self.moves[slot] = MOVE_INDEX[move] if move is not None else -1
+
+    def move_entry(self, source, target):
+        if self.depths[target] >= 0:
+            self.overwrites += 1
+        self.keys[target] = self.keys[source]
+        self.scores[target] = self.scores[source]
+        self.depths[target] = self.depths[source]
+        self.bounds[target] = self.bounds[source]
+        self.moves[target] = self.moves[source]
+
+    def clear(self):
+        size = len(self.keys)
+        self.depths = array('b', [-1]) * size
+        self.probes = self.hits = self.stores = self.overwrites = 0
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self):
+        return {
+            "entries": len(self.keys),
+            "bytes": len(self.keys) * ENTRY_SIZE,
+            "probes": self.probes,
+            "hits": self.hits,
+            "hit_rate": self.hit_rate(),
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+        }
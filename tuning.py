@@ -0,0 +1,167 @@
+"""
+Tuning of the get_weights() coefficients by self-play
+    python tuning.py [--budget 600] [--workers 8] [--checkpoint tuning.json] [--output coefficients.json]
+    - the candidates are random perturbations of the default Coefficients, candidate 0 is the defaults
+    - successive halving: every candidate alive plays min_games games, the best 1 / eta of them play eta times more
+    - a candidate plays one snake against snakes with the default coefficients, on the same seeded games for every
+      candidate, and scores the share of rivals it outlived (a draw counts half)
+    - the games are played in a process pool until the wall clock budget is spent
+    - the checkpoint is written after every finished task, running again with the same checkpoint resumes the search
+The best coefficients are written to --output, the server loads them with COEFFICIENTS=<output>.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+
+from preprocessing import Coefficients
+from simulator import Game, play, weights_player
+
+try:  # the weights are computed by the same class as in server.py
+    from vectorized import VectorizedPreprocessing as Preprocessing
+except ImportError:  # NumPy is not installed
+    from preprocessing import Preprocessing
+
+
+def perturb(coefficients, sigma, rng):
+    """
+    :return: to_dict() of coefficients, every number multiplied by exp(N(0, sigma)), the last health bound is kept
+    """
+    def scale(value):
+        return round(value * math.exp(rng.gauss(0, sigma)), 2)
+
+    params = coefficients.to_dict()
+    bounds = sorted(min(max(round(scale(bound)), 1), 99) for bound in params["health"][:-1])
+    params["health"] = bounds + params["health"][-1:]  # every health must still have a food coefficient
+    params["food"] = [scale(value) for value in params["food"]]
+    for name in ("rival_food", "unit_weight", "food_falloff", "food_offset", "hazard"):
+        params[name] = scale(params[name])
+    params["corners"] = [[scale(value) for value in row] for row in params["corners"]]
+    return params
+
+
+def game_score(result, me):
+    """
+    :return: share of the rivals that were eliminated before me, 0.5 for every rival eliminated on the same turn
+    """
+    def end(i):
+        eliminated = result["eliminated"][i]
+        return eliminated[0] if eliminated is not None else math.inf
+
+    rivals = [end(i) for i in range(len(result["eliminated"])) if i != me]
+    mine = end(me)
+    return sum(1 if turn < mine else 0.5 if turn == mine else 0 for turn in rivals) / len(rivals)
+
+
+def run_task(task):
+    """
+    Runs in a worker process
+    :return: (candidate index, [(seed, score) of every game])
+    """
+    index, params, seeds, settings = task
+    candidate = weights_player(settings["level"], preprocessing=Preprocessing, coefficients=Coefficients(**params))
+    default = weights_player(settings["level"], preprocessing=Preprocessing)
+    scores = []
+    for seed in seeds:
+        me = seed % settings["snakes"]
+        players = [candidate if i == me else default for i in range(settings["snakes"])]
+        game = Game(settings["size"], settings["size"], settings["snakes"], seed)
+        scores.append((seed, game_score(play(game, players, settings["max_turns"]), me)))
+    return index, scores
+
+
+class Tuner:
+    def __init__(self, checkpoint=None, candidates=16, sigma=0.3, seed=0, size=11, snakes=4, level=5, max_turns=500,
+                 min_games=8, eta=2, chunk=4):
+        """
+        :param checkpoint: JSON file of the search, loaded if it exists, the other parameters are then ignored
+        :param sigma: spread of the perturbations, in log scale
+        :param chunk: games per task sent to the pool
+        """
+        self.checkpoint = checkpoint
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                state = json.load(f)
+            self.settings = state["settings"]
+            self.candidates = state["candidates"]
+            for candidate in self.candidates:
+                candidate["scores"] = {int(seed): score for seed, score in candidate["scores"].items()}
+        else:
+            self.settings = {"size": size, "snakes": snakes, "level": level, "max_turns": max_turns,
+                             "min_games": min_games, "eta": eta, "chunk": chunk, "seed": seed, "sigma": sigma}
+            rng = random.Random(seed)
+            defaults = Coefficients()
+            self.candidates = [{"params": defaults.to_dict(), "scores": {}}]  # scores: game seed -> score
+            self.candidates += [{"params": perturb(defaults, sigma, rng), "scores": {}} for _ in range(candidates - 1)]
+
+    def save(self):
+        if self.checkpoint:
+            with open(self.checkpoint + ".tmp", 'w') as f:
+                json.dump({"settings": self.settings, "candidates": self.candidates}, f)
+            os.replace(self.checkpoint + ".tmp", self.checkpoint)  # never leave a half written checkpoint
+
+    def mean(self, index, games=None):
+        scores = self.candidates[index]["scores"]
+        values = [scores[seed] for seed in range(games) if seed in scores] if games else list(scores.values())
+        return sum(values) / len(values) if values else 0.0
+
+    def run(self, budget, workers=None):
+        """
+        :param budget: seconds of wall clock
+        :return: (index of the best candidate, True if the search finished within the budget)
+        """
+        deadline = time.monotonic() + budget
+        settings = self.settings
+        alive = list(range(len(self.candidates)))
+        games = settings["min_games"]
+        with multiprocessing.Pool(workers or os.cpu_count()) as pool:
+            while True:
+                tasks = []
+                for index in alive:
+                    missing = [seed for seed in range(games) if seed not in self.candidates[index]["scores"]]
+                    for i in range(0, len(missing), settings["chunk"]):
+                        tasks.append((index, self.candidates[index]["params"], missing[i:i + settings["chunk"]],
+                                      settings))
+                results = pool.imap_unordered(run_task, tasks)
+                for _ in tasks:
+                    try:
+                        index, scores = results.next(max(deadline - time.monotonic(), 0))
+                    except multiprocessing.TimeoutError:
+                        return max(alive, key=self.mean), False
+                    self.candidates[index]["scores"].update(scores)
+                    self.save()
+                if len(alive) == 1:
+                    return alive[0], True
+                alive = sorted(alive, key=lambda index: self.mean(index, games), reverse=True)
+                alive = alive[:max(1, len(alive) // settings["eta"])]
+                games *= settings["eta"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=600, help="seconds of wall clock")
+    parser.add_argument("--workers", type=int, default=None, help="processes, one per CPU core by default")
+    parser.add_argument("--checkpoint", default="tuning.json", help="resumed if the file exists")
+    parser.add_argument("--output", default="coefficients.json")
+    parser.add_argument("--candidates", type=int, default=16)
+    parser.add_argument("--sigma", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size", type=int, default=11)
+    parser.add_argument("--snakes", type=int, default=4)
+    parser.add_argument("--level", type=int, default=5, help="get_shortest_path() level of the players")
+    parser.add_argument("--min-games", type=int, default=8)
+    parser.add_argument("--eta", type=int, default=2)
+    args = parser.parse_args()
+
+    tuner = Tuner(args.checkpoint, args.candidates, args.sigma, args.seed, args.size, args.snakes, args.level,
+                  min_games=args.min_games, eta=args.eta)
+    best, finished = tuner.run(args.budget, args.workers)
+    Coefficients(**tuner.candidates[best]["params"]).save(args.output)
+    print("finished" if finished else "budget spent, run again with --checkpoint %s to resume" % args.checkpoint)
+    print("best candidate %d: %.3f over %d games, defaults: %.3f over %d games" % (
+        best, tuner.mean(best), len(tuner.candidates[best]["scores"]),
+        tuner.mean(0), len(tuner.candidates[0]["scores"])))
@@ -0,0 +1,173 @@
+"""
+NumPy version of Preprocessing.get_weights()
+    - corner, snake, food and hazard layers are computed on whole arrays instead of cell by cell
+    - the breadth-first spreading of avoid_snakes() and detect_food() is replayed one ordered frontier per level,
+      so self.weights matches the loops exactly
+    - on a board of at most PATCH_GRIDS grids, patching the weights of the previous turn in loops is cheaper than the
+      arrays, see Preprocessing.update_weights(), so the layers are kept for the next turn
+"""
+
+import numpy as np
+
+from preprocessing import Preprocessing, INT_MAX, CORNER_WEIGHTS, get_corner_weights
+
+PATCH_GRIDS = 15 * 15
+arrays_lookup = {}
+
+
+def get_arrays(width, height, corner_weights=CORNER_WEIGHTS):
+    """
+    :return: (corner_weights, neighbors), computed once per board size and corner weights
+        corner_weights  get_corner_weights() as an array
+        neighbors       neighbors[y * width + x, i] is the flat index of the grid towards
+                        ['up', 'down', 'left', 'right'][i], -1 if it is outside the board
+    """
+    arrays = arrays_lookup.get((width, height, corner_weights))
+    if arrays is None:
+        index = np.arange(width * height).reshape(height, width)
+        neighbors = np.full((height, width, 4), -1)
+        neighbors[:-1, :, 0] = index[1:, :]
+        neighbors[1:, :, 1] = index[:-1, :]
+        neighbors[:, 1:, 2] = index[:, :-1]
+        neighbors[:, :-1, 3] = index[:, 1:]
+        arrays = (np.array(get_corner_weights(width, height, corner_weights), dtype=float), neighbors.reshape(-1, 4))
+        arrays_lookup[(width, height, corner_weights)] = arrays
+    return arrays
+
+
+def shift(layer, direction):
+    """
+    :return: out[grid + direction] = layer[grid], grids moved outside the board are dropped
+    """
+    out = np.zeros_like(layer)
+    if direction == 'up':
+        out[1:, :] = layer[:-1, :]
+    elif direction == 'down':
+        out[:-1, :] = layer[1:, :]
+    elif direction == 'left':
+        out[:, :-1] = layer[:, 1:]
+    else:
+        out[:, 1:] = layer[:, :-1]
+    return out
+
+
+def round_weights(values):
+    """
+    np.round() of values * 10 rounds differently from the "{:.1f}".format() of the loops, which rounds the exact
+    binary value, e.g. 8.95 is 8.9499... and formats to 8.9 but becomes 9.0 with np.round(). The two only differ
+    next to a tie of values * 10, so only those values are formatted
+    :return: values rounded to one decimal, the same as the loops
+    """
+    rounded = np.round(values, 1)
+    scaled = values * 10
+    for i in np.nonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)[0]:
+        rounded[i] = float("{:.1f}".format(values[i]))
+    return rounded
+
+
+class VectorizedPreprocessing(Preprocessing):
+    def get_weights(self, horizon=None, exact=True):
+        if horizon is not None:  # the lazy mode weighs a few grids, cheaper in loops than whole arrays
+            return Preprocessing.get_weights(self, horizon, exact)
+        patch = self.width * self.height <= PATCH_GRIDS
+        previous = self.previous_weights() if patch else None
+        self.previous = None
+        if previous is not None:
+            self.update_weights(previous)
+            return
+        corner_weights, _ = get_arrays(self.width, self.height, self.coefficients.corners)
+        board = np.array(self.board)
+        weights = np.array(self.weights, dtype=float)
+        weights[(board >= 1) & (board <= 3)] = INT_MAX
+        weights = np.maximum(weights, corner_weights)  # avoid_corners()
+
+        free = weights < INT_MAX
+        snake_weights = self.snake_layer(free)
+        food_weights = self.food_layer(self.food_coefficient())
+        weights[free] += snake_weights[free]  # avoid_snakes()
+        weights[free] = round_weights(weights[free] + food_weights[free])  # detect_food()
+        if patch:  # for the next turn
+            self.snake_weights, self.food_weights = snake_weights.tolist(), food_weights.tolist()
+        self.hazard_weights = self.get_hazard_weights()
+        if self.hazard_weights is not None:  # avoid_hazards()
+            hazard_weights = np.array(self.hazard_weights, dtype=float)
+            spent = free & (hazard_weights > 0) & (hazard_weights < INT_MAX)
+            weights[spent] = round_weights(weights[spent] + hazard_weights[spent])
+            weights[free & (hazard_weights >= INT_MAX)] = INT_MAX
+        self.weights = weights.tolist()
+
+    def snake_layer(self, free):
+        snake_weights = np.zeros((self.height, self.width))
+        bodies = []
+        for snake in self.snakes:
+            if snake["head"] != self.me["head"] and snake["length"] >= self.me["length"]:
+                for _, y, x in self.neighbors[snake["head"]['y'] * self.width + snake["head"]['x']]:
+                    snake_weights[y, x] += 4
+            bodies.extend(body['y'] * self.width + body['x'] for body in snake["body"][:-1])
+        if not bodies:
+            return snake_weights
+        level_0 = np.bincount(bodies, minlength=self.width * self.height).reshape(self.height, self.width)
+
+        for directions, corner in ((('up', 'left'), (self.height - 1, 0)), (('down', 'right'), (0, self.width - 1))):
+            first, second = directions
+            level_1 = shift(level_0, first) + shift(level_0, second)
+            queued = level_1 * free
+            if level_0[corner] or queued[corner]:
+                # The corner has no neighbor in these directions, spread_from_bodies() may stop early there
+                spread = [[0] * self.width for _ in range(self.height)]
+                self.spread_from_bodies(spread, directions)
+                snake_weights += spread
+            else:
+                snake_weights += 2 * level_1 + shift(queued, first) + shift(queued, second)
+        return snake_weights
+
+    def food_layer(self, coef):
+        """
+        Replay of detect_food(): the grids of level + 1 are the unset neighbors of level, ordered by
+        (parent's position in the queue, direction), and the spreading stops where the loop does
+        """
+        _, neighbors = get_arrays(self.width, self.height, self.coefficients.corners)
+        unit_weight = self.coefficients.unit_weight * coef
+        falloff, offset = self.coefficients.food_falloff, self.coefficients.food_offset
+        food_weights = np.zeros(self.width * self.height)
+        entries = []
+        for food in self.food:
+            y, x = food['y'], food['x']
+            if self.me["health"] > 6 and \
+                    any(self.board[ny][nx] == 2 for _, ny, nx in self.neighbors[y * self.width + x]):
+                continue  # if the food is reachable by a rival in one move, then ignore it
+            entries.append(y * self.width + x)
+            food_weights[entries[-1]] = min(unit_weight, food_weights[entries[-1]])
+        if not entries:
+            return food_weights.reshape(self.height, self.width)
+
+        last = entries[-1]
+        entries = np.array(entries)
+        level = 0
+        while len(entries):
+            weight = unit_weight + (level * falloff + offset)
+            if weight >= 0:
+                break
+            candidates = neighbors[entries].ravel()
+            position = np.nonzero(candidates >= 0)[0]
+            position = position[food_weights[candidates[position]] == 0]
+            cells, first = np.unique(candidates[position], return_index=True)
+            order = np.argsort(first)
+            cells, parent = cells[order], position[first[order]] // 4
+
+            processed = 1 if level == 4 else len(entries)
+            rank = int(np.argmax(entries == last))
+            stop = level == 4
+            if rank < processed:
+                children = cells[parent == rank]
+                if len(children):
+                    last = children[0]
+                else:
+                    processed, stop = rank + 1, True
+            cells = cells[parent < processed]
+            food_weights[cells] = weight
+            if stop:
+                break
+            entries = cells
+            level += 1
+        return food_weights.reshape(self.height, self.width)